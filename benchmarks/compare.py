@@ -0,0 +1,74 @@
+"""
+Compares two benchmark result files saved by run.py.
+
+    python benchmarks/compare.py before.json after.json
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base, new, threshold=1.1):
+    """
+    Rows of (benchmark, size, base, new, ratio, verdict) for every
+    measurement present in both runs, using median times.
+    """
+    rows = []
+    for name, sizes in new["results"].items():
+        for size, result in sizes.items():
+            previous = base["results"].get(name, {}).get(size)
+            if previous is None or "median" not in previous or "median" not in result:
+                continue
+            ratio = result["median"] / previous["median"]
+            if ratio > threshold:
+                verdict = "slower"
+            elif ratio < 1 / threshold:
+                verdict = "faster"
+            else:
+                verdict = ""
+            rows.append(
+                (name, int(size), previous["median"], result["median"], ratio, verdict)
+            )
+    return rows
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base", help="Reference results")
+    parser.add_argument("new", help="Results to compare against the reference")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="Ratio of medians reported as a change (default: 1.1)",
+    )
+    parser.add_argument(
+        "--fail",
+        action="store_true",
+        help="Exit with status 1 when any benchmark got slower",
+    )
+    options = parser.parse_args(args)
+
+    base, new = load(options.base), load(options.new)
+    print(f"base: {base['meta'].get('revision')}  {base['meta'].get('date')}")
+    print(f"new:  {new['meta'].get('revision')}  {new['meta'].get('date')}")
+    print(f"{'benchmark':<34} {'size':>8} {'base ms':>11} {'new ms':>11} {'ratio':>7}")
+    rows = compare(base, new, options.threshold)
+    for name, size, before, after, ratio, verdict in rows:
+        print(
+            f"{name:<34} {size:>8} {before * 1000:>11.3f} {after * 1000:>11.3f}"
+            f" {ratio:>6.2f}x {verdict}"
+        )
+    if options.fail and any(verdict == "slower" for *_, verdict in rows):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
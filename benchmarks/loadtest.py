@@ -0,0 +1,595 @@
+"""
+Drives simulated dashboard users against a local us_population server over
+the trame websocket protocol and reports update latency, throughput and
+server memory.
+
+    python benchmarks/loadtest.py --clients 1 10 50 --duration 30 -o load.json
+    python benchmarks/loadtest.py --clients 20 -- --heatmap-mode incremental
+
+Arguments after ``--`` are passed to the server. Each simulated user keeps
+a websocket open and, after an exponentially distributed think time, either
+steps through the years/components (mostly to the next one, sometimes a
+random jump), switches the color theme, or drags the window: a burst of
+``heatmap_size``/``line_size`` updates of which only the last one counts.
+The latency of an action is the time until the server pushes the state it
+causes (the selection title, the choropleth patch, the heatmap or line).
+
+A trame server keeps one state shared by all of its clients, so every
+client also receives the updates caused by the others, as browser tabs on
+the same server would. An action whose state another client changes before
+its update arrives is counted as superseded rather than timed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import aiohttp
+import msgpack
+from wslink.chunking import UnChunker, generate_chunks
+
+from run import git_revision
+
+SECRET = "wslink-secret"
+THEMES = ["blues", "cividis", "greens", "inferno", "magma", "plasma", "reds", "viridis"]
+SIZES = [(640, 360), (800, 450), (960, 540), (1200, 680)]
+MAX_MESSAGE = 4 * 1024 * 1024 * 1024
+
+# ---------------------------------------------------------
+# Responses
+#
+# Each action waits for a pushed state entry matching one of these.
+# ---------------------------------------------------------
+
+
+def is_title(key, value, expected):
+    return value == f"### Population {expected}"
+
+
+def is_choropleth(key, value, expected):
+    return key == "choropleth_patch" and value is not None
+
+
+def is_heatmap(key, value, expected):
+    if key == "heatmap_signals":
+        return True
+    if not isinstance(value, dict) or "$schema" not in value:
+        return False
+    return "rect" in str(value.get("mark"))
+
+
+def is_line(key, value, expected):
+    return isinstance(value, dict) and "axes" in value and "plugins" in value
+
+
+# ---------------------------------------------------------
+# Simulated user
+# ---------------------------------------------------------
+
+
+class Client:
+    """One websocket session speaking the wslink/trame protocol"""
+
+    def __init__(self, name, url, stats, rng, think=1.0, timeout=10.0):
+        self.name = name
+        self.url = url
+        self.stats = stats
+        self.rng = rng
+        self.think = think
+        self.timeout = timeout
+        self.state = {}
+        self.keys = []
+        self.pending = []
+        self.calls = {}
+        self.serial = 0
+        self.unchunker = UnChunker()
+        self.unchunker.set_max_message_size(MAX_MESSAGE)
+        self.ws = None
+
+    async def send(self, message):
+        for chunk in generate_chunks(msgpack.packb(message), 512 * 1024):
+            await self.ws.send_bytes(chunk)
+
+    async def call(self, method, *args, system=False):
+        self.serial += 1
+        rpcid = f"{'system' if system else 'rpc'}:{self.name}:{self.serial}"
+        future = asyncio.get_running_loop().create_future()
+        self.calls[rpcid] = future
+        await self.send(
+            {"wslink": "1.0", "id": rpcid, "method": method, "args": list(args)}
+        )
+        return await asyncio.wait_for(future, self.timeout)
+
+    async def receive(self):
+        async for message in self.ws:
+            if message.type != aiohttp.WSMsgType.BINARY:
+                continue
+            self.stats.received_bytes += len(message.data)
+            message = self.unchunker.process_chunk(message.data)
+            if message is None:
+                continue
+            rpcid = message.get("id", "")
+            if rpcid in self.calls:
+                future = self.calls.pop(rpcid)
+                if "error" in message:
+                    future.set_exception(RuntimeError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+            elif rpcid.startswith("publish:trame.state.topic"):
+                self.stats.pushes += 1
+                self.on_state(message.get("result") or {})
+
+    def on_state(self, changes):
+        self.state.update(changes)
+        now = time.perf_counter()
+        for entry in list(self.pending):
+            action, source, expected, matches, start, done = entry
+            if any(matches(key, value, expected) for key, value in changes.items()):
+                self.stats.record(action, now - start)
+            elif source in changes:
+                # Another client changed the same state first, the server
+                # drops the now stale render
+                self.stats.count(self.stats.superseded, action)
+            else:
+                continue
+            self.pending.remove(entry)
+            done.set_result(None)
+
+    def expect(self, action, source, expected, matches):
+        """Future resolved by the update ``action`` causes, timed from now"""
+        done = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        self.pending.append((action, source, expected, matches, start, done))
+        return done
+
+    async def wait(self, action, done):
+        try:
+            await asyncio.wait_for(asyncio.shield(done), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.count(self.stats.timeouts, action)
+            self.pending = [entry for entry in self.pending if entry[-1] is not done]
+
+    async def update(self, *changes):
+        # The server does not echo a client's own changes back to it
+        self.state.update(changes)
+        await self.call(
+            "trame.state.update",
+            [{"key": key, "value": value} for key, value in changes],
+        )
+
+    # -----------------------------------------------------
+    # Actions
+    # -----------------------------------------------------
+
+    async def browse(self):
+        current = self.state.get("selectedComponentOrYear")
+        index = self.keys.index(current) if current in self.keys else -1
+        if self.rng.random() < 0.7:
+            key = self.keys[(index + 1) % len(self.keys)]
+        else:
+            key = self.rng.choice([key for key in self.keys if key != current])
+        done = self.expect("selection", "selectedComponentOrYear", key, is_title)
+        await self.update(("selectedComponentOrYear", key))
+        await self.wait("selection", done)
+
+    async def theme(self):
+        current = self.state.get("selectedColorTheme")
+        theme = self.rng.choice([theme for theme in THEMES if theme != current])
+        done = self.expect("theme", "selectedColorTheme", theme, is_choropleth)
+        await self.update(("selectedColorTheme", theme))
+        await self.wait("theme", done)
+
+    async def resize(self):
+        current = (self.state.get("heatmap_size") or {}).get("size", {})
+        width, height = self.rng.choice(
+            [size for size in SIZES if size[0] != current.get("width")]
+        )
+        for step in range(5, 0, -1):
+            # The drag ends on the chosen size, earlier events are superseded
+            heatmap = {"size": {"width": width - 20 * (step - 1), "height": height}}
+            line = {
+                "size": {"width": width // 3 - 10 * (step - 1), "height": height // 2},
+                "dpi": 96,
+                "pixelRatio": 1,
+            }
+            if step == 1:
+                heatmap_done = self.expect("heatmap", "heatmap_size", None, is_heatmap)
+                line_done = self.expect("line", "line_size", None, is_line)
+            await self.update(("heatmap_size", heatmap), ("line_size", line))
+            if step > 1:
+                await asyncio.sleep(0.03)
+        await asyncio.gather(
+            self.wait("heatmap", heatmap_done), self.wait("line", line_done)
+        )
+
+    async def run(self, deadline):
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.url, max_msg_size=0) as ws:
+                self.ws = ws
+                receiver = asyncio.ensure_future(self.receive())
+                try:
+                    await self.call("wslink.hello", {"secret": SECRET}, system=True)
+                    start = time.perf_counter()
+                    initial = await self.call("trame.state.get")
+                    self.stats.record("connect", time.perf_counter() - start)
+                    self.state.update(initial.get("state", {}))
+                    self.keys = list(self.state.get("component_year") or [])
+                    actions = [self.browse] * 14 + [self.theme] * 3 + [self.resize] * 3
+                    while time.perf_counter() < deadline:
+                        await asyncio.sleep(self.rng.expovariate(1 / self.think))
+                        if time.perf_counter() >= deadline:
+                            break
+                        await self.rng.choice(actions)()
+                finally:
+                    receiver.cancel()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.timeouts = {}
+        self.superseded = {}
+        self.pushes = 0
+        self.received_bytes = 0
+
+    def record(self, action, seconds):
+        self.latencies.setdefault(action, []).append(seconds)
+
+    def count(self, counter, action):
+        counter[action] = counter.get(action, 0) + 1
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def at(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "count": len(values),
+        "p50": statistics.median(values),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": values[-1],
+    }
+
+
+# ---------------------------------------------------------
+# Server process
+# ---------------------------------------------------------
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, server_args):
+    command = [
+        sys.executable,
+        "-m",
+        "us_population.app.main",
+        "--server",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        *server_args,
+    ]
+    process = subprocess.Popen(
+        command,
+        cwd=Path(__file__).parents[1],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Server did not start listening within 60s")
+
+
+def process_tree(pid):
+    """``pid`` and its descendants, read from /proc"""
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if entry.name.isdigit():
+            try:
+                stat = (entry / "stat").read_text()
+            except OSError:
+                continue
+            parent = int(stat.rsplit(")", 1)[1].split()[1])
+            children.setdefault(parent, []).append(int(entry.name))
+    tree, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        tree.append(current)
+        todo.extend(children.get(current, []))
+    return tree
+
+
+def memory(pid):
+    """
+    Resident (RSS) and proportional (PSS) memory in bytes of ``pid`` and its
+    children, None off Linux. RSS counts pages shared between processes once
+    per process, PSS splits them between the processes sharing them, so the
+    PSS total is the memory the server actually uses.
+    """
+    totals = {"rss": 0, "pss": 0}
+    try:
+        pids = process_tree(pid)
+    except OSError:
+        return None
+    for current in pids:
+        for key, name, field in (
+            ("rss", "status", "VmRSS:"),
+            ("pss", "smaps_rollup", "Pss:"),
+        ):
+            try:
+                lines = Path(f"/proc/{current}/{name}").read_text().splitlines()
+            except OSError:
+                continue
+            for line in lines:
+                if line.startswith(field):
+                    totals[key] += int(line.split()[1]) * 1024
+    return totals
+
+
+async def sample_memory(pid, samples, interval=0.5):
+    while True:
+        value = memory(pid)
+        if value is not None:
+            samples.append(value)
+        await asyncio.sleep(interval)
+
+
+# ---------------------------------------------------------
+# Runner
+# ---------------------------------------------------------
+
+
+async def run_step(url, clients, duration, pid=None, think=1.0, timeout=10.0, seed=0):
+    stats = Stats()
+    samples = []
+    sampler = asyncio.ensure_future(sample_memory(pid, samples)) if pid else None
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + duration
+    sessions = [
+        Client(f"c{index}", url, stats, random.Random(rng.random()), think, timeout)
+        for index in range(clients)
+    ]
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(session.run(deadline) for session in sessions), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    if sampler is not None:
+        sampler.cancel()
+
+    errors = [f"{type(error).__name__}: {error}" for error in results if error]
+    actions = {
+        action: percentiles(values)
+        for action, values in sorted(stats.latencies.items())
+        if action != "connect"
+    }
+    updates = [
+        value
+        for action, values in stats.latencies.items()
+        if action != "connect"
+        for value in values
+    ]
+    return {
+        "clients": clients,
+        "seconds": elapsed,
+        "latency": percentiles(updates),
+        "actions": actions,
+        "connect": percentiles(stats.latencies.get("connect", [])),
+        "timeouts": stats.timeouts,
+        "superseded": stats.superseded,
+        "errors": errors,
+        "throughput": len(updates) / elapsed,
+        "pushes_per_second": stats.pushes / elapsed,
+        "received_bytes_per_second": stats.received_bytes / elapsed,
+        "rss_peak": max(sample["rss"] for sample in samples) if samples else None,
+        "pss_peak": max(sample["pss"] for sample in samples) if samples else None,
+        "memory_end": samples[-1] if samples else None,
+    }
+
+
+def report(step):
+    latency = step["latency"]
+    line = f"{step['clients']:>5} clients  {step['throughput']:>7.1f} updates/s"
+    if latency["count"]:
+        line += "".join(
+            f"  {name} {latency[name] * 1000:>7.1f} ms"
+            for name in ("p50", "p95", "p99")
+        )
+    if step["rss_peak"]:
+        line += f"  rss {step['rss_peak'] / 2**20:>6.1f} MB"
+    if step["pss_peak"]:
+        line += f"  pss {step['pss_peak'] / 2**20:>6.1f} MB"
+    superseded = sum(step["superseded"].values())
+    timeouts = sum(step["timeouts"].values())
+    if superseded or timeouts or step["errors"]:
+        line += (
+            f"  ({superseded} superseded, {timeouts} timeouts,"
+            f" {len(step['errors'])} errors)"
+        )
+    print(line, flush=True)
+
+
+def check(steps, max_p95=None, min_throughput=None, max_rss=None, max_pss=None):
+    """Steps breaching the latency, throughput or memory gates, as messages"""
+    failures = []
+    for step in steps:
+        for name, limit in (("rss", max_rss), ("pss", max_pss)):
+            peak = step[f"{name}_peak"]
+            if limit is not None and (peak is None or peak / 2**20 > limit):
+                failures.append(f"{step['clients']} clients: {name} above {limit} MB")
+        p95 = step["latency"].get("p95")
+        if max_p95 is not None and (p95 is None or p95 * 1000 > max_p95):
+            failures.append(f"{step['clients']} clients: p95 above {max_p95} ms")
+        if min_throughput is not None and step["throughput"] < min_throughput:
+            failures.append(
+                f"{step['clients']} clients: throughput below {min_throughput}/s"
+            )
+    return failures
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--clients",
+        type=int,
+        nargs="+",
+        default=[1, 5, 10],
+        help="Concurrent clients of each step (default: 1 5 10)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=20.0,
+        help="Seconds each step runs for (default: 20)",
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=1.0,
+        help="Mean seconds between two actions of a client (default: 1)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Seconds an action waits for its update (default: 10)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=5.0,
+        help="Seconds of one unrecorded client first, so that one-time imports "
+        "and first renders are not measured (default: 5)",
+    )
+    parser.add_argument(
+        "--url",
+        help="Websocket of an already running server instead of starting one, "
+        "e.g. ws://127.0.0.1:8080/ws",
+    )
+    parser.add_argument(
+        "--pid", type=int, help="Process to sample memory from when using --url"
+    )
+    parser.add_argument(
+        "--max-p95",
+        type=float,
+        help="Exit with status 1 when a step's p95 latency exceeds this many ms",
+    )
+    parser.add_argument(
+        "--min-throughput",
+        type=float,
+        help="Exit with status 1 when a step handles fewer updates per second",
+    )
+    parser.add_argument(
+        "--max-rss",
+        type=float,
+        help="Exit with status 1 when the server's peak resident memory during "
+        "a step exceeds this many MB",
+    )
+    parser.add_argument(
+        "--max-pss",
+        type=float,
+        help="Exit with status 1 when the server's peak proportional set size "
+        "during a step exceeds this many MB",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="loadtest-results.json",
+        help="Where to save the results (default: loadtest-results.json)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    options, server_args = parser.parse_known_args(args)
+    server_args = [arg for arg in server_args if arg != "--"]
+
+    process = None
+    url, pid = options.url, options.pid
+    if url is None:
+        port = free_port()
+        process = start_server(port, server_args)
+        url, pid = f"ws://127.0.0.1:{port}/ws", process.pid
+
+    steps = []
+    try:
+        if options.warmup > 0:
+            asyncio.run(run_step(url, 1, options.warmup, think=0.2, seed=-1))
+        memory_idle = memory(pid) if pid else None
+        for clients in options.clients:
+            step = asyncio.run(
+                run_step(
+                    url,
+                    clients,
+                    options.duration,
+                    pid,
+                    options.think,
+                    options.timeout,
+                    options.seed,
+                )
+            )
+            report(step)
+            steps.append(step)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+    results = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "server_args": server_args,
+            "duration": options.duration,
+            "think": options.think,
+            "warmup": options.warmup,
+            "memory_idle": memory_idle,
+        },
+        "steps": steps,
+    }
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {options.output}")
+
+    failures = check(
+        steps,
+        options.max_p95,
+        options.min_throughput,
+        options.max_rss,
+        options.max_pss,
+    )
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Times the engine functions of us_population.app.core and a headless
+selection change on synthetic datasets of increasing size.
+
+    python benchmarks/run.py --sizes 52 1000 10000 100000 -o before.json
+    python benchmarks/compare.py before.json after.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas
+
+from synthetic import synthetic_store, write_csv
+
+SIZES = [52, 1_000, 10_000, 100_000]
+KEY = "2015"
+
+# ---------------------------------------------------------
+# Benchmarks
+#
+# Each benchmark takes a Dataset and returns the callable to time.
+# Chart builders are timed together with the serialization the
+# dashboard sends, since that is where most of their time goes.
+# ---------------------------------------------------------
+
+
+class Dataset:
+    def __init__(self, regions, workdir):
+        self.regions = regions
+        self.workdir = Path(workdir)
+        self.store = synthetic_store(regions)
+        self.selected = self.store.select(KEY)
+        self.years = self.store.years
+        self.totals = self.store.totals(self.years)
+
+    @property
+    def cube(self):
+        from us_population.app.cube import MetricsCube
+
+        return MetricsCube(self.store)
+
+
+def bench_format_number(data):
+    from us_population.app.core import format_number
+
+    values = data.selected.population.tolist()
+    return lambda: [format_number(value) for value in values]
+
+
+def bench_metrics_cube(data):
+    """Every derived metric of every year, computed once per dataset"""
+    from us_population.app.cube import MetricsCube
+
+    return lambda: MetricsCube(data.store)
+
+
+def bench_make_gains_losses(data):
+    from us_population.app.core import make_gains, make_losses
+
+    cube = data.cube
+    return lambda: (make_gains(cube, KEY), make_losses(cube, KEY))
+
+
+def bench_make_donuts(data):
+    """Above/below percentages and both donut specs of a selection"""
+    from us_population.app import specs
+
+    cube = data.cube
+
+    def donuts():
+        above, below = cube.threshold_percentages(KEY)
+        return specs.donut(above, "Above", "above"), specs.donut(
+            below, "Below", "below"
+        )
+
+    return donuts
+
+
+def bench_rank(data):
+    """Top and bottom 5 states of a selection by change over the previous year"""
+    from us_population.app.ranking import RankingEngine
+
+    engine = RankingEngine(data.store)
+    engine.cube
+    return lambda: engine.rank(KEY, "difference", 5)
+
+
+def bench_make_donut(data):
+    """Donut spec the dashboard sends, emitted without Altair"""
+    from us_population.app import specs
+
+    above, _ = data.cube.threshold_percentages(KEY)
+    return lambda: specs.donut(above, "Above", "above")
+
+
+def bench_altair_donut(data):
+    from trame.widgets import vega
+
+    from us_population.app.core import make_donut
+
+    above, _ = data.cube.threshold_percentages(KEY)
+    return lambda: vega.Figure.to_data(make_donut(above, "Above", "above"))
+
+
+def bench_range_selection(data):
+    """Gains/losses, donut percentages and ranking of the widest year range"""
+    from us_population.app.cube import range_key
+    from us_population.app.ranking import RankingEngine
+
+    engine = RankingEngine(data.store)
+    cube = engine.cube
+    key = range_key(data.years[0], data.years[-1])
+    return lambda: (
+        cube.extremes(key),
+        cube.threshold_percentages(key),
+        engine.rank(key, "growth", 5),
+    )
+
+
+def bench_make_choropleth(data):
+    from trame.widgets import plotly
+
+    from us_population.app.core import make_choropleth
+
+    return lambda: plotly.Figure.to_data(
+        make_choropleth(data.selected, "states_code", "population", "blues")
+    )
+
+
+def bench_choropleth_patch(data):
+    """Per-selection update of the choropleth once its skeleton was sent"""
+    from us_population.app.choropleth import patch
+
+    locations = data.selected.states_code.to_numpy()
+    return lambda: patch(data.store, KEY, "blues", locations)
+
+
+def bench_make_heatmap(data):
+    """Inline heatmap spec the dashboard sends, emitted without Altair"""
+    from us_population.app import specs
+
+    df_years = data.store.select(*data.years)
+    return lambda: specs.heatmap(df_years, "blues", 600, 400)
+
+
+def bench_altair_heatmap(data):
+    from trame.widgets import vega
+
+    from us_population.app.core import make_heatmap
+
+    df_years = data.store.select(*data.years)
+    return lambda: vega.Figure.to_data(
+        make_heatmap(df_years, "year", "states", "population", "blues", 600, 400)
+    )
+
+
+def bench_make_line(data):
+    from us_population.app.core import make_line
+    from us_population.widgets.figures import MatplotlibFigure
+
+    return lambda: MatplotlibFigure.to_data(
+        make_line(data.years, data.totals, 300, 300, 192, 2)
+    )
+
+
+def bench_on_component_or_year_change(data):
+    """Every panel of a selection, synchronously and with a cold render cache"""
+    from trame.app import get_server
+
+    from us_population.app.cache import render_cache
+    from us_population.app.core import MyTrameApp
+
+    csv_path = write_csv(data.workdir / f"regions-{data.regions}.csv", data.regions)
+    server = get_server(f"benchmark-{data.regions}", client_type="vue3")
+    app = MyTrameApp(
+        server,
+        data_path=csv_path,
+        render_delay=0,
+        heatmap_mode="inline",
+        defer_render=True,
+    )
+
+    # A ready state runs the change listeners on flush, as in a served app
+    app.state.ready()
+    keys = itertools.cycle([KEY, str(int(KEY) - 1)])
+
+    def change():
+        render_cache.invalidate()
+        with app.state:
+            app.state.selectedComponentOrYear = next(keys)
+
+    return change
+
+
+BENCHMARKS = {
+    "format_number": bench_format_number,
+    "metrics_cube": bench_metrics_cube,
+    "make_gains_losses": bench_make_gains_losses,
+    "make_donuts": bench_make_donuts,
+    "rank": bench_rank,
+    "range_selection": bench_range_selection,
+    "make_donut": bench_make_donut,
+    "altair_donut": bench_altair_donut,
+    "make_choropleth": bench_make_choropleth,
+    "choropleth_patch": bench_choropleth_patch,
+    "make_heatmap": bench_make_heatmap,
+    "altair_heatmap": bench_altair_heatmap,
+    "make_line": bench_make_line,
+    "on_component_or_year_change": bench_on_component_or_year_change,
+}
+
+# ---------------------------------------------------------
+# Runner
+# ---------------------------------------------------------
+
+
+def measure(function, min_time=0.5, max_runs=50):
+    """
+    Wall times of ``function``, repeated until they add up to ``min_time``.
+    A first untimed call absorbs lazy imports and library caches.
+    """
+    function()
+    times = []
+    while not times or (len(times) < max_runs and sum(times) < min_time):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times):
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "runs": len(times),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, names, min_time=0.5, max_seconds=10.0):
+    """
+    Runs the ``names`` benchmarks on every size. Once a benchmark fails or
+    takes more than ``max_seconds`` per call, its larger sizes are recorded
+    as skipped.
+    """
+    results = {name: {} for name in names}
+    stopped = set()
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sorted(sizes):
+            data = Dataset(size, workdir)
+            for name in names:
+                if name in stopped:
+                    results[name][str(size)] = {"skipped": True}
+                    continue
+                try:
+                    summary = summarize(measure(BENCHMARKS[name](data), min_time))
+                except Exception as error:
+                    message = f"{type(error).__name__}: {str(error).splitlines()[0]}"
+                    results[name][str(size)] = {"error": message}
+                    print(f"{name:<34} {size:>8}  failed, {message}", flush=True)
+                    stopped.add(name)
+                    continue
+                results[name][str(size)] = summary
+                print(
+                    f"{name:<34} {size:>8} {summary['median'] * 1000:>11.3f} ms"
+                    f"  ({summary['runs']} runs)",
+                    flush=True,
+                )
+                if summary["median"] > max_seconds:
+                    stopped.add(name)
+
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pandas.__version__,
+        },
+        "results": results,
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=SIZES,
+        help="Number of regions of the synthetic datasets",
+    )
+    parser.add_argument(
+        "-k",
+        dest="filter",
+        default="",
+        help="Only run the benchmarks whose name contains this text",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="Seconds spent repeating each measurement (default: 0.5)",
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=10.0,
+        help="Skip larger sizes once a call takes longer (default: 10)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="benchmark-results.json",
+        help="Where to save the results (default: benchmark-results.json)",
+    )
+    options = parser.parse_args(args)
+
+    names = [name for name in BENCHMARKS if options.filter in name]
+    results = run(options.sizes, names, options.min_time, options.max_seconds)
+    with open(options.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {options.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
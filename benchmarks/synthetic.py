@@ -0,0 +1,57 @@
+"""Synthetic population datasets for the benchmarks"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas
+
+from us_population.app.store import PopulationStore
+
+COMPONENTS = [
+    "Change",
+    "Natural",
+    "Births",
+    "Deaths",
+    "Migration",
+    "International",
+    "Domestic",
+]
+YEARS = [str(year) for year in range(2010, 2020)]
+
+# Real codes are cycled through so the choropleth still resolves locations
+DATA = Path(__file__).parents[1] / "data" / "us-population.csv"
+STATE_CODES = pandas.read_csv(DATA, usecols=["states_code"]).states_code.unique()
+
+
+def synthetic_frame(regions, seed=0):
+    """Long-format table with ``regions`` regions and the dashboard's keys"""
+    rng = np.random.default_rng(seed)
+    names = np.array([f"Region {index:06d}" for index in range(regions)])
+    codes = STATE_CODES[np.arange(regions) % len(STATE_CODES)]
+
+    population = rng.integers(500_000, 40_000_000, size=regions)
+    blocks = []
+    for key in COMPONENTS:
+        blocks.append((key, rng.integers(-200_000, 400_000, size=regions)))
+    for key in YEARS:
+        blocks.append((key, population.copy()))
+        population += rng.integers(-150_000, 250_000, size=regions)
+
+    return pandas.DataFrame(
+        {
+            "states": np.tile(names, len(blocks)),
+            "states_code": np.tile(codes, len(blocks)),
+            "id": np.tile(np.arange(1, regions + 1), len(blocks)),
+            "year": np.repeat([key for key, _ in blocks], regions),
+            "population": np.concatenate([values for _, values in blocks]),
+        }
+    )
+
+
+def synthetic_store(regions, seed=0):
+    return PopulationStore.from_frame(synthetic_frame(regions, seed))
+
+
+def write_csv(path, regions, seed=0):
+    synthetic_frame(regions, seed).to_csv(path)
+    return path
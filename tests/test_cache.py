@@ -0,0 +1,28 @@
+from us_population.app.cache import RenderCache
+
+
+def test_render_cache_lru():
+    cache = RenderCache(maxsize=2)
+    calls = []
+
+    def render(value):
+        calls.append(value)
+        return {"value": value}
+
+    assert cache.get_or_render("a", lambda: render(1)) == {"value": 1}
+    assert cache.get_or_render("a", lambda: render(2)) == {"value": 1}
+    cache.get_or_render("b", lambda: render(3))
+    cache.get_or_render("c", lambda: render(4))
+
+    assert calls == [1, 3, 4]
+    assert "a" not in cache
+    assert cache.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 1,
+        "misses": 3,
+        "evictions": 1,
+    }
+
+    cache.invalidate(lambda key: key == "b")
+    assert "b" not in cache and "c" in cache
@@ -0,0 +1,44 @@
+import base64
+import json
+
+import numpy as np
+from trame.widgets import plotly
+
+from us_population.app.choropleth import patch, skeleton
+from us_population.app.core import color_theme_list, make_choropleth
+from us_population.app.dataset import DEFAULT_DATA, load_store
+
+
+def decoded(array):
+    if isinstance(array, list):
+        return array
+    dtype = np.dtype(array["dtype"]).newbyteorder("<")
+    return np.frombuffer(base64.b64decode(array["bdata"]), dtype).tolist()
+
+
+def figure(store, key, theme):
+    chart = make_choropleth(store.select(key), "states_code", "population", theme)
+    return json.loads(json.dumps(plotly.Figure.to_data(chart)))
+
+
+def test_skeleton_and_patch_match_plotly_express():
+    store = load_store(DEFAULT_DATA)
+    base = json.loads(json.dumps(skeleton(figure(store, store.keys[0], "blues"))))
+    locations = base["data"][0]["locations"]
+
+    for key in ("Change", "2011", "2019"):
+        for theme in color_theme_list:
+            expected = figure(store, key, theme)
+            coloraxis = expected["layout"].pop("coloraxis")
+            trace = {**base["data"][0], **patch(store, key, theme, locations)}
+
+            assert base["layout"] == expected["layout"]
+            assert decoded(trace["z"]) == decoded(expected["data"][0]["z"])
+            assert trace["locations"] == expected["data"][0]["locations"]
+            assert (trace["zmin"], trace["zmax"]) == (
+                coloraxis["cmin"],
+                coloraxis["cmax"],
+            )
+            assert (
+                json.loads(json.dumps(trace["colorscale"])) == coloraxis["colorscale"]
+            )
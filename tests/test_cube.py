@@ -0,0 +1,99 @@
+import numpy as np
+import pandas
+
+from us_population.app.cube import MetricsCube, parse_range, range_key, range_touches
+from us_population.app.dataset import DEFAULT_DATA, load_store
+from us_population.app.store import PopulationStore
+
+
+def test_cube_matches_pandas_pipeline():
+    store = load_store(DEFAULT_DATA)
+    cube = MetricsCube(store)
+    frame = store.frame.astype({"year": str, "states": str})
+
+    for key in store.years[1:]:
+        previous = str(int(key) - 1)
+        merged = frame[frame.year == key].merge(
+            frame[frame.year == previous], on="states", suffixes=("", "_previous")
+        )
+        merged["difference"] = merged.population - merged.population_previous
+        ordered = merged.sort_values("difference", ascending=False, kind="stable")
+
+        gain, loss = cube.extremes(key)
+        assert gain == tuple(ordered.iloc[0][["states", "population", "difference"]])
+        assert loss == tuple(ordered.iloc[-1][["states", "population", "difference"]])
+        above = (merged.difference > 50000).mean()
+        below = (merged.difference < -50000).mean()
+        assert cube.threshold_percentages(key) == (
+            round(above * 100),
+            round(below * 100),
+        )
+
+        order, values, _ = cube.ranked(key, "growth")
+        growth = 100 * merged.difference / merged.population_previous
+        assert np.allclose(values[order], growth.sort_values(ascending=False))
+
+    assert cube.extremes(store.years[0]) is None
+    assert cube.threshold_percentages("Births") == (0, 0)
+    assert cube.row("Births", "difference") == ("population", cube.index["Births"])
+
+
+def test_cube_skips_missing_states():
+    store = PopulationStore.from_frame(
+        pandas.DataFrame(
+            {
+                "states": ["A", "B", "A", "B", "C"],
+                "states_code": ["AA", "BB", "AA", "BB", "CC"],
+                "id": [1, 2, 1, 2, 3],
+                "year": ["2010", "2010", "2011", "2011", "2011"],
+                "population": [100, 200, 150, 100, 70],
+            }
+        )
+    )
+    cube = MetricsCube(store, threshold=20)
+
+    order, values, scale = cube.ranked("2010", "population")
+    assert [store.states[code] for code in order] == ["B", "A"]
+    order, values, scale = cube.ranked("2011", "difference")
+    assert [store.states[code] for code in order] == ["C", "A", "B"]
+    assert list(values[order]) == [70, 50, -100] and scale == 100
+    order, values, _ = cube.ranked("2011", "growth")
+    assert [store.states[code] for code in order] == ["A", "B"]
+    assert cube.threshold_percentages("2011") == (67, 33)
+
+
+def test_range_metrics_match_direct_computation():
+    store = load_store(DEFAULT_DATA)
+    cube = MetricsCube(store)
+    assert cube.span("2012") is None and cube.span("2017-2012") is None
+    assert cube.span("2009-2012") is None
+
+    for start, end in [("2010", "2011"), ("2012", "2017"), ("2010", "2019")]:
+        span = cube.span(range_key(start, end))
+        years = [year for year in store.years if start <= year <= end]
+        levels = np.array([store.aligned(year) for year in years])
+        change = store.aligned(end) - store.aligned(start)
+
+        assert list(span.values["difference"]) == list(change)
+        assert np.allclose(span.values["population"], levels.mean(axis=0))
+        assert span.total_change == store.totals([end])[0] - store.totals([start])[0]
+        assert np.isclose(span.total_mean, np.mean(store.totals(years)))
+
+        gain, loss = span.extremes()
+        assert gain[0] == store.states[np.argmax(change)]
+        assert loss[2] == change.min()
+        annual = change / (len(years) - 1)
+        assert span.threshold_percentages() == (
+            round(np.mean(annual > 50000) * 100),
+            round(np.mean(annual < -50000) * 100),
+        )
+
+    # A single year step is the year's difference
+    assert cube.extremes("2010-2011") == cube.extremes("2011")
+
+
+def test_range_touches():
+    assert parse_range("2012-2017") == ("2012", "2017")
+    assert parse_range("Births") is None and parse_range("2015") is None
+    assert range_touches("2012-2017", {"2015"})
+    assert not range_touches("2012-2017", {"2011", "2018"})
@@ -0,0 +1,31 @@
+import json
+
+from us_population.app.core import DashboardRenderer
+from us_population.app.dataset import DEFAULT_DATA, load_store
+from us_population.app.export import ExportedDashboard, export_dashboard
+
+
+def normalized(payload):
+    return json.loads(json.dumps(payload))
+
+
+def test_export_serves_live_payloads(tmp_path):
+    manifest = export_dashboard(tmp_path, DEFAULT_DATA, processes=1, themes=["reds"])
+    assert (tmp_path / "manifest.json").exists()
+    live = DashboardRenderer(load_store(DEFAULT_DATA))
+    exported = ExportedDashboard(tmp_path)
+    assert manifest["keys"] == exported.keys == live.keys
+    for key in live.keys:
+        for metric, k in (("population", 5), ("difference", 3), ("Births", 12)):
+            expected = live.make_selection(key, "reds", metric, k)
+            actual = exported.make_selection(key, "reds", metric, k)
+            for name, build in live.panels.items():
+                assert normalized(build(expected)) == normalized(
+                    exported.panels[name](actual)
+                ), (key, name)
+
+    size = {"width": 640, "height": 380}
+    assert normalized(live.heatmap("reds", size)) == exported.heatmap("reds", size)
+    assert exported.line_view().render(400, 250, 192, 2)["width"] == (
+        live.line_view().render(400, 250, 192, 2)["width"]
+    )
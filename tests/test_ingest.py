@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pandas
+
+from us_population.app.ingest import ingest_csv
+from us_population.app.store import PopulationStore
+
+DATA = Path(__file__).parents[1] / "data" / "us-population.csv"
+
+
+def test_chunked_ingestion_matches_csv():
+    expected = PopulationStore.from_csv(DATA)
+    for chunksize in (7, 100, 10_000):
+        store = ingest_csv(DATA, chunksize).to_store()
+        assert store.keys == expected.keys
+        assert store.token == expected.token
+        for name in PopulationStore.columns:
+            assert list(store.frame[name]) == list(expected.frame[name])
+
+
+def test_rows_are_summed_per_state_and_key(tmp_path):
+    path = tmp_path / "counties.csv"
+    pandas.DataFrame(
+        {
+            "states": ["Utah", "Utah", "Iowa", "Utah", "Iowa", "Iowa"],
+            "states_code": ["UT", "UT", "IA", "UT", "IA", "IA"],
+            "id": [49, 49, 19, 49, 19, 19],
+            "county": ["a", "b", "c", "a", "c", "d"],
+            "year": [1990, 1990, 1990, 1991, 1991, 1991],
+            "population": [10, 20, 5, 11, 6, 1],
+        }
+    ).to_csv(path)
+
+    aggregator = ingest_csv(path, chunksize=2)
+    assert aggregator.totals() == {"1990": 35, "1991": 18}
+    assert aggregator.series("Iowa") == {"1990": 5, "1991": 7}
+
+    store = aggregator.to_store()
+    assert store.years == ["1990", "1991"]
+    assert list(store.states) == ["Utah", "Iowa"]
+    assert list(store.population("1991")) == [11, 7]
+    assert list(store.select("1991").states_code) == ["UT", "IA"]
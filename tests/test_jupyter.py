@@ -0,0 +1,22 @@
+from us_population.app import jupyter
+
+
+def test_sessions_share_the_server_and_data():
+    first = jupyter.session()
+    second = jupyter.session()
+
+    assert first.server.root_server is second.server.root_server is jupyter.server()
+    assert first.renderer is second.renderer
+    assert first.ui.template_name != second.ui.template_name
+
+    second.state.selectedComponentOrYear = "2015"
+    second.render_selection()
+    assert first.state.selectedComponentOrYear == "2011"
+    assert first.state[first.views["title"].key] == "### Population 2011"
+    assert second.state[second.views["title"].key] == "### Population 2015"
+
+
+def test_jupyter_proxy_info():
+    info = jupyter.jupyter_proxy_info()
+    assert info["command"][0] == "us-population"
+    assert "{port}" in info["command"]
@@ -0,0 +1,52 @@
+from us_population.app.metrics import Histogram, Metrics, disabled
+
+
+def test_histogram_buckets_and_quantile():
+    histogram = Histogram([1, 2, 4])
+    for value in (0.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+
+    counts, total, count = histogram.snapshot()
+    assert counts == [2, 1, 1, 1]
+    assert (total, count) == (16, 5)
+    assert 1 <= histogram.quantile(0.5) <= 2
+
+
+def test_exposition_format():
+    metrics = Metrics()
+    with metrics.callback("on_color_change"):
+        pass
+    metrics.payload("title", "### Population 2011")
+    text = metrics.exposition()
+
+    assert "# TYPE us_population_payload_bytes histogram" in text
+    assert 'us_population_payload_bytes_bucket{view="title",le="256.0"} 1' in text
+    assert 'us_population_payload_bytes_bucket{view="title",le="+Inf"} 1' in text
+    assert 'us_population_payload_bytes_sum{view="title"} 19' in text
+    assert (
+        'us_population_callback_wall_seconds_count{callback="on_color_change"} 1'
+        in text
+    )
+
+
+def test_payload_size_is_measured_once_per_object():
+    metrics = Metrics()
+    payload = {"data": list(range(100))}
+    size = len('{"data":[' + ",".join(map(str, range(100))) + "]}")
+    metrics.payload("heatmap", payload)
+    payload["data"].append(100)  # the same object is not serialized again
+    metrics.payload("heatmap", payload)
+    metrics.payload("heatmap", {"data": list(range(101))})  # a new one is
+
+    _, total, count = metrics.histogram("payload_bytes", (), view="heatmap").snapshot()
+    assert count == 3
+    assert total == size + size + len(",100") + size
+
+
+def test_disabled_records_nothing():
+    build = disabled.timed_panel("title", lambda selection: selection)
+    assert build("x") == "x"
+    with disabled.callback("anything"):
+        pass
+    disabled.payload("title", "text")
+    assert disabled.histograms == {}
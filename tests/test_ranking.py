@@ -0,0 +1,34 @@
+import numpy as np
+
+from us_population.app.core import ranking_headers, ranking_titles
+from us_population.app.dataset import DEFAULT_DATA, load_store
+from us_population.app.ranking import RankingEngine, bottom_k, percentages, top_k
+
+
+def test_top_bottom_k_match_full_sort():
+    rng = np.random.default_rng(0)
+    values = rng.integers(-1000, 1000, size=500)
+    order = np.argsort(-values, kind="stable")
+
+    for k in (0, 1, 5, 499, 500, 600):
+        assert list(top_k(values, k)) == list(order[:k])
+        assert list(bottom_k(values, k)) == list(order[::-1][:k])
+
+
+def test_percentages():
+    assert list(percentages([50, -25, 12.5], 50)) == [100, -50, 25]
+    assert list(percentages([1, 2], 0)) == [0, 0]
+
+
+def test_rank_reports_the_metric_ranked_by():
+    engine = RankingEngine(load_store(DEFAULT_DATA))
+    for key in ("Births", "2010"):
+        top, _, metric = engine.rank(key, "difference", 5)
+        assert metric == "population"
+        assert top == engine.rank(key, "population", 5)[0]
+    assert ranking_titles(metric, 5)[0] == "### Top 5 States"
+    assert ranking_headers(metric)[1]["title"] == "Population"
+
+    assert engine.rank("2011", "growth", 5)[2] == "growth"
+    assert engine.rank("2011-2015", "growth", 5)[2] == "growth"
+    assert engine.rank("Births", "Deaths", 5)[2] == "Deaths"
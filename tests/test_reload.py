@@ -0,0 +1,80 @@
+import shutil
+
+import pandas
+
+from us_population.app.cache import RenderCache, render_cache
+from us_population.app.core import DashboardRenderer, render_choropleth_patch
+from us_population.app.dataset import DEFAULT_DATA, load_store
+from us_population.app.reload import DataChange, DataWatcher, carry_over
+
+
+def edit_csv(path, year, state, delta):
+    frame = pandas.read_csv(path, index_col=0, dtype={"year": str})
+    rows = (frame.year == year) & (frame.states == state)
+    frame.loc[rows, "population"] += delta
+    frame.to_csv(path)
+
+
+def test_data_change_and_incremental_totals(tmp_path):
+    csv_path = tmp_path / "population.csv"
+    shutil.copy(DEFAULT_DATA, csv_path)
+    previous = load_store(csv_path)
+    renderer = DashboardRenderer(previous)
+
+    edit_csv(csv_path, "2013", "Texas", 1000)
+    change = DataChange(previous, load_store(csv_path))
+    assert change.keys == change.years == {"2013"}
+    assert change.selections == {"2013", "2014"}
+    assert not change.axes_changed and not change.skeleton_changed
+    assert change.affects("2012-2015") and not change.affects("2014-2019")
+    assert list(change.rows.index) == [("2013", "Texas")]
+    insert, remove = change.heatmap_changes()
+    assert remove == [{"states": "Texas", "year": "2013"}]
+    assert insert[0]["population"] == int(change.rows["population_new"].iloc[0])
+
+    totals = renderer.population
+    renderer.reload(change)
+    assert renderer.population == change.store.totals(change.store.years)
+    assert [a - b for a, b in zip(renderer.population, totals)] == [
+        1000 if year == "2013" else 0 for year in renderer.years
+    ]
+
+
+def test_carry_over_keeps_unaffected_payloads(tmp_path):
+    csv_path = tmp_path / "population.csv"
+    shutil.copy(DEFAULT_DATA, csv_path)
+    previous = load_store(csv_path)
+    for key in ("2012", "2015"):
+        render_choropleth_patch(previous, key, "reds")
+
+    edit_csv(csv_path, "2015", "Ohio", -5)
+    change = DataChange(previous, load_store(csv_path))
+    # A copy, so that the process-wide cache keeps its entries
+    cache = RenderCache()
+    for key, value in render_cache.items():
+        cache.put(key, value)
+    assert carry_over(change, cache) >= 2  # the skeleton and the 2012 patch
+    new = change.store.token
+    assert ("choropleth_patch", new, "2012", "reds") in cache
+    assert ("choropleth_patch", new, "2015", "reds") not in cache
+    assert not any(key[1] == previous.token for key, _ in cache.items())
+
+
+def test_watcher_waits_for_the_file_to_settle(tmp_path):
+    csv_path = tmp_path / "population.csv"
+    shutil.copy(DEFAULT_DATA, csv_path)
+    watcher = DataWatcher(csv_path, load_store(csv_path))
+    assert watcher.poll() is None
+
+    edit_csv(csv_path, "Births", "Utah", 7)
+    assert watcher.poll() is None
+    change = watcher.poll()
+    assert change.keys == {"Births"} and not change.years
+    assert watcher.store is change.store
+    assert watcher.poll() is None
+
+    # The cube of the new data is built by the watcher, not by the renderers
+    cube = change.ranking.cube
+    renderer = DashboardRenderer(change.previous)
+    renderer.reload(change)
+    assert renderer.cube is cube
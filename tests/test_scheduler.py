@@ -0,0 +1,31 @@
+import asyncio
+
+from us_population.app.scheduler import RenderScheduler
+
+
+def test_scheduler_coalesces_bursts():
+    scheduler = RenderScheduler(delay=0.02)
+    rendered, applied = [], []
+
+    def request(value):
+        def render():
+            rendered.append(value)
+            return value
+
+        scheduler.schedule("size", render, applied.append)
+
+    async def burst():
+        for value in range(10):
+            request(value)
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(burst())
+    assert rendered == [9]
+    assert applied == [9]
+
+
+def test_scheduler_without_loop_is_synchronous():
+    applied = []
+    RenderScheduler().schedule("size", lambda: 1, applied.append)
+    assert applied == [1]
@@ -0,0 +1,62 @@
+import pytest
+from trame.widgets import vega
+
+from us_population.app import specs
+from us_population.app.core import color_theme_list, make_donut, make_heatmap
+from us_population.app.dataset import DEFAULT_DATA, load_store
+
+
+@pytest.fixture
+def validation():
+    specs.set_validation(True)
+    yield
+    specs.set_validation(False)
+
+
+@pytest.mark.parametrize("value", [0, 1, 37, 100])
+@pytest.mark.parametrize("text, option", [("Above", "above"), ("Below", "below")])
+def test_donut_matches_altair(validation, value, text, option):
+    expected = vega.Figure.to_data(make_donut(value, text, option))
+    assert specs.donut(value, text, option) == expected
+
+
+@pytest.mark.parametrize("theme", color_theme_list)
+def test_heatmap_matches_altair(validation, theme):
+    store = load_store(DEFAULT_DATA)
+    df_years = store.select(*store.years)
+    expected = vega.Figure.to_data(
+        make_heatmap(df_years, "year", "states", "population", theme, 600, 400)
+    )
+    assert specs.heatmap(df_years, theme, 600, 400) == expected
+
+    expected = vega.Figure.to_data(
+        make_heatmap(
+            {"name": "population"},
+            "year",
+            "states",
+            "population",
+            theme,
+            641,
+            455,
+            scheme_param="colorScheme",
+        )
+    )
+    template = specs.heatmap(
+        {"name": "population"}, theme, 641, 455, scheme_param="colorScheme"
+    )
+    assert template == expected
+
+
+def test_schema_is_the_one_altair_targets():
+    import altair
+
+    assert specs.SCHEMA == altair.SCHEMA_URL
+
+
+def test_validation_rejects_invalid_specs(validation):
+    import jsonschema
+
+    spec = specs.donut(37, "Above", "above")
+    spec["layer"][0]["mark"]["type"] = "doughnut"
+    with pytest.raises(jsonschema.ValidationError):
+        specs.validate(spec)
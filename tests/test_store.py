@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import pandas
+
+from us_population.app.store import PopulationStore
+
+DATA = Path(__file__).parents[1] / "data" / "us-population.csv"
+
+
+def test_store_matches_csv():
+    df_raw = pandas.read_csv(DATA, dtype={"year": str})
+    store = PopulationStore.from_csv(DATA)
+
+    assert store.years == [str(year) for year in range(2010, 2020)]
+    assert store.components[0] == "Change"
+    for key in store.keys:
+        expected = df_raw[df_raw.year == key]
+        selected = store.select(key)
+        assert list(selected.states) == list(expected.states)
+        assert list(store.population(key)) == list(expected.population)
+        assert store.totals([key]) == [int(expected.population.sum())]
+
+
+def test_binary_store_roundtrip(tmp_path):
+    from us_population.app import dataset
+
+    csv_path = tmp_path / "us-population.csv"
+    csv_path.write_bytes(DATA.read_bytes())
+    store_path = dataset.convert(csv_path)
+
+    assert not dataset.is_stale(store_path, csv_path)
+    binary = dataset.open_binary(store_path)
+    assert binary.frame.equals(PopulationStore.from_csv(csv_path).frame)
+
+    with open(csv_path, "a") as f:
+        f.write("\n")
+    assert dataset.is_stale(store_path, csv_path)
+
+
+def test_shared_store_is_memory_mapped(tmp_path):
+    import numpy as np
+
+    from us_population.app import dataset
+
+    csv_path = tmp_path / "us-population.csv"
+    csv_path.write_bytes(DATA.read_bytes())
+    shared = tmp_path / "shared"
+    dataset.share_stores(shared)
+    try:
+        store = dataset.load_store(csv_path)
+    finally:
+        dataset.share_stores(None)
+
+    values = store.frame["population"].to_numpy()
+    while values.base is not None and not isinstance(values, np.memmap):
+        values = values.base
+    assert isinstance(values, np.memmap)
+    assert list(shared.iterdir()) == [shared / f"us-population-{store.token}.store"]
+    assert store.token == PopulationStore.from_csv(csv_path).token
+
+
+def test_shared_store_is_written_once_per_version(tmp_path):
+    import os
+
+    from us_population.app import dataset
+
+    csv_path = tmp_path / "us-population.csv"
+    csv_path.write_bytes(DATA.read_bytes())
+    shared = tmp_path / "shared"
+    store = dataset.read_store(csv_path)
+    output = dataset.share_binary(store, shared, csv_path)
+    written = os.stat(output / "population.npy")
+
+    # A process loading the same version maps the files already there
+    assert dataset.share_binary(store, shared, csv_path) == output
+    assert os.stat(output / "population.npy") == written
+
+    # A new version replaces the previous one
+    csv_path.write_text(DATA.read_text().replace(",4785437", ",4785438", 1))
+    changed = dataset.read_store(csv_path)
+    assert changed.token != store.token
+    output = dataset.share_binary(changed, shared, csv_path)
+    assert list(shared.iterdir()) == [output]
@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+from trame_server.state import State
+
+from us_population.app.pipeline import PanelPipeline
+from us_population.app.scheduler import RenderScheduler
+from us_population.app.transaction import Transactions
+
+
+def recording_state():
+    pushes = []
+    state = State(commit_fn=lambda update: pushes.append(dict(update)), ready=True)
+    return state, pushes
+
+
+def test_nested_blocks_commit_once():
+    state, pushes = recording_state()
+    transactions = Transactions(state)
+    with transactions.join():
+        transactions["title"] = "2015"
+        with transactions.join():
+            transactions.update(top5=[1], title="2016")
+        assert pushes == []
+    assert pushes == [{"title": "2016", "top5": [1]}]
+
+    # Values the client already has are not pushed again
+    with transactions.join():
+        transactions.update(title="2016", top5=[2])
+    assert pushes[-1] == {"top5": [2]}
+
+
+def panels(delays):
+    def build(name, delay):
+        def render(key):
+            time.sleep(delay)
+            return f"{name} {key}"
+
+        return render
+
+    return {name: build(name, delay) for name, delay in delays.items()}
+
+
+def test_overlapping_actions_commit_independently():
+    pushes, times = [], []
+    start = time.perf_counter()
+
+    def push(update):
+        pushes.append(dict(update))
+        times.append(time.perf_counter() - start)
+
+    state = State(commit_fn=push, ready=True)
+    transactions = Transactions(state)
+    scheduler = RenderScheduler(delay=0.05)
+    pipeline = PanelPipeline()
+    selection_panels = panels({"title": 0, "gains": 0, "choropleth": 0.03})
+
+    def apply(name, result):
+        with transactions.join():
+            transactions[name] = result
+
+    def select(key):
+        with transactions.join():
+            transactions.track(pipeline.run(lambda: key, selection_panels, apply))
+
+    def resize(size):
+        with transactions.action():
+            transactions.track(
+                scheduler.schedule("size", lambda: size, lambda r: apply("size", r))
+            )
+
+    async def run():
+        # Resizes every 20 ms for 0.5 s, with selections in between
+        for step in range(25):
+            resize(step)
+            if step in (5, 15):
+                select(f"20{step}")
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.3)
+
+    asyncio.run(run())
+    assert pushes == [
+        {"title": "title 205", "gains": "gains 205", "choropleth": "choropleth 205"},
+        {"title": "title 2015", "gains": "gains 2015", "choropleth": "choropleth 2015"},
+        {"size": 24},
+    ]
+    # The selections did not wait for the resizes to settle
+    assert times[0] < 0.3 and times[1] < 0.5 < times[2]
+
+
+def test_slow_renders_do_not_hold_changes_past_max_latency():
+    state, pushes = recording_state()
+    transactions = Transactions(state, max_latency=0.05)
+    pipeline = PanelPipeline()
+
+    def apply(name, result):
+        with transactions.join():
+            transactions[name] = result
+
+    async def run():
+        with transactions.join():
+            transactions.track(
+                pipeline.run(
+                    lambda: "2015", panels({"title": 0, "choropleth": 0.3}), apply
+                )
+            )
+        await asyncio.sleep(0.15)
+        assert pushes == [{"title": "title 2015"}]
+        await asyncio.sleep(0.3)
+
+    asyncio.run(run())
+    assert pushes == [{"title": "title 2015"}, {"choropleth": "choropleth 2015"}]
+
+
+def test_without_a_loop_an_action_commits_on_exit():
+    state, pushes = recording_state()
+    transactions = Transactions(state)
+    applied = []
+
+    def apply(name, result):
+        with transactions.join():
+            transactions[name] = result
+            applied.append(len(pushes))
+
+    with transactions.join():
+        transactions.track(
+            PanelPipeline().run(lambda: "2015", panels({"a": 0, "b": 0}), apply)
+        )
+    assert applied == [0, 0]
+    assert pushes == [{"a": "a 2015", "b": "b 2015"}]
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from threading import RLock
+
+# ---------------------------------------------------------
+# Render cache
+# ---------------------------------------------------------
+
+
+class RenderCache:
+    """
+    Bounded LRU mapping of render keys to serialized chart payloads.
+
+    The cache is shared by every session of the process, so cached
+    payloads must be treated as read-only.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        # Render outside of the lock so other keys are not blocked
+        value = render()
+        self.put(key, value)
+        return value
+
+    def items(self):
+        """Snapshot of the entries, least recently used first"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def invalidate(self, predicate=None):
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Process-wide cache shared by every MyTrameApp instance
+render_cache = RenderCache()
@@ -0,0 +1,81 @@
+import base64
+
+import numpy as np
+
+from .cache import render_cache
+
+# ---------------------------------------------------------
+# Choropleth skeleton and patches
+#
+# The plotly express figure is only built once per dataset. Its color axis
+# is moved onto the trace, so that a selection or theme change is fully
+# described by a small patch of trace attributes:
+#
+#   {"z": [...], "zmin": ..., "zmax": ..., "colorscale": [...]}
+#
+# which the client merges into the skeleton trace (Plotly.react diffs it).
+# ---------------------------------------------------------
+
+
+def colorscale(theme):
+    """Colorscale plotly express resolves the named ``theme`` to"""
+
+    def resolve():
+        from plotly.graph_objects import layout
+
+        stops = layout.Coloraxis(colorscale=theme).to_plotly_json()["colorscale"]
+        return [list(stop) for stop in stops]
+
+    return render_cache.get_or_render(("colorscale", theme), resolve)
+
+
+def typed_array(values):
+    """Plotly.js typed array spec, the encoding plotly uses for figure arrays"""
+    values = np.asarray(values)
+    if len(values) == 0:
+        return []
+    if np.abs(values).max() <= np.iinfo(np.int32).max:
+        dtype, values = "i4", values.astype("<i4")
+    else:
+        dtype, values = "f8", values.astype("<f8")
+    return {"dtype": dtype, "bdata": base64.b64encode(values.tobytes()).decode("ascii")}
+
+
+def skeleton(figure):
+    """Figure payload with the color axis moved onto its trace and no ``z``"""
+    layout = dict(figure["layout"])
+    coloraxis = layout.pop("coloraxis", {})
+    trace = {
+        name: value
+        for name, value in figure["data"][0].items()
+        if name not in ("coloraxis", "z")
+    }
+    trace.update(
+        z=[],
+        zmin=coloraxis.get("cmin"),
+        zmax=coloraxis.get("cmax"),
+        colorscale=coloraxis.get("colorscale"),
+        colorbar=coloraxis.get("colorbar", {}),
+        autocolorscale=False,
+    )
+    return {"data": [trace], "layout": layout}
+
+
+def patch(store, key, theme, locations=None, values=None):
+    """
+    Trace attributes of ``key`` drawn with ``theme``. Locations are only
+    included when they differ from the skeleton ``locations``. ``values``
+    replaces the population of the states of ``key``, e.g. by their change
+    over a year range.
+    """
+    values = store.population(key) if values is None else np.asarray(values)
+    result = {
+        "z": typed_array(values),
+        "zmin": int(values.min()) if len(values) else 0,
+        "zmax": int(values.max()) if len(values) else 0,
+        "colorscale": colorscale(theme),
+    }
+    codes = store.select(key)["states_code"].to_numpy()
+    if locations is None or not np.array_equal(codes, locations):
+        result["locations"] = codes.tolist()
+    return result
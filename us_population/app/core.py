@@ -1,32 +1,47 @@
+import argparse
+from types import SimpleNamespace
 
 from trame.app import get_server
 from trame.decorators import TrameApp, change, controller
 from trame.ui.vuetify3 import SinglePageWithDrawerLayout
-from trame.widgets import html, markdown, matplotlib, plotly, trame, vega, vuetify3
+from trame.widgets import html, markdown, plotly, trame, vega, vuetify3
 
-import altair as alt
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 import pandas
-import plotly.express as px
 import numpy as np
 
+from ..widgets.figures import MatplotlibFigure
+from ..widgets.us_population import VegaDataView
+from . import choropleth
+from . import cube as metrics_cube
+from . import metrics as instrumentation
+from . import profiling
+from . import reload as data_reload
+from . import specs
+from .cache import render_cache
+from .dataset import DEFAULT_DATA, load_store
+from .line import LineView, figure_size
+from .metrics import instrumented
+from .pipeline import PanelPipeline
+from .ranking import RankingEngine
+from .scheduler import RenderScheduler
+from .transaction import Transactions
+
+# altair, plotly.express and matplotlib are imported by the make_* functions
+# so that they only load once the corresponding view first renders. The donut
+# and heatmap payloads are emitted by the specs module, make_donut and
+# make_heatmap are the Altair charts those specs are checked against.
+
 about_content = """## About\n\
  - Data: [U.S. Census Bureau](https://www.census.gov/data/datasets/time-series/demo/popest/2010s-state-total.html).\n\
  - <span style="color:orange">**Components**</span>: Decade population change and the natural and migration additions and subtractions.\n\
  - <span style="color:orange">**Years**</span>: Individual years in the decade that spans 2010 to 2019.\n\
  - <span style="color:orange">**Gains/Losses**</span>: states with high and low annual population growth for selected year.\n\
  - <span style="color:orange">**States Growth**</span>: percentage of states with above 50K and below -50K annual population growth.\n"""
-component_or_year = ["Change", "Natural", "Births", "Deaths", "Migration", "International", "Domestic",
-                     "2010", "2011", "2012", "2013", "2014", "2015", "2016", "2017", "2018", "2019"]
-components_2010 = ["Change", "Natural", "Births", "Deaths", "Migration", "International", "Domestic", "2010"]
-years = ["2010", "2011", "2012", "2013", "2014", "2015", "2016", "2017", "2018", "2019"]
 color_theme_list = ['blues', 'cividis', 'greens', 'inferno', 'magma', 'plasma', 'reds', 'rainbow', 'turbo', 'viridis']
 table_headers = [
     { 'title': 'State', 'key': 'state', 'sortable': False },
     { 'title': 'Population', 'key': 'population', 'sortable': False }
     ]
-population_labels = ['313M', '315M', '317M', '319M', '321M', '324M', '326M', '328M', '329M', '331M']
 top5 = [
     { 'state': 'Alabama', 'population':  10, 'rank': 1},
     { 'state': 'Alaska', 'population': 9, 'rank': 2 },
@@ -54,52 +69,38 @@ def format_number(num):
         return f'{round(num / 1000000, 1)} M'
     return f'{num // 1000} K'
 
-# Calculation year-over-year population migrations
-def calculate_population_difference(input_df, input_year):
-    if (input_year in components_2010):
-        return None
-    else:
-        selected_df = input_df[input_df['year'] == input_year].reset_index()
-        previous_df = input_df[input_df['year'] == str(int(input_year) - 1)].reset_index()
-        selected_df['difference'] = selected_df.population.sub(previous_df.population, 
-                                                               fill_value=0)
-        return pandas.concat([selected_df.states, 
-                              selected_df.id, 
-                              selected_df.population, 
-                              selected_df.difference], 
-                              axis=1).sort_values(by="difference", 
-                                                  ascending=False)
-
 # Gains
-def make_gains(input_df, input_year):
-    if (input_year in components_2010):
+def make_gains(input_cube, input_year):
+    extremes = input_cube.extremes(input_year)
+    if extremes is None:
         name = 'N/A'
         population = '0 M'
         delta = '0 K'
         gains_md = ""+name+"  \n<span style='font-size:2.0em;'>"+population+"</span>  \n<span style='color:black'>&harr;"+delta+"</span>"
         return gains_md
     else:
-        name = input_df.states.iloc[0]
-        population = format_number(input_df.population.iloc[0])
-        delta = format_number(input_df.difference.iloc[0])
+        name, population, delta = extremes[0]
+        population = format_number(population)
+        delta = format_number(delta)
         if delta[0] != '-':
             gains_md = ""+name+"  \n<span style='font-size:2.0em;'>"+population+"</span>  \n<span style='color:green'>&uarr;"+delta+"</span>"
         else:
             gains_md = ""+name+"  \n<span style='font-size:2.0em;'>"+population+"</span>  \n<span style='color:red'>&darr;"+delta+"</span>"
         return gains_md
 
-# Gains
-def make_losses(input_df, input_year):
-    if (input_year in components_2010):
+# Losses
+def make_losses(input_cube, input_year):
+    extremes = input_cube.extremes(input_year)
+    if extremes is None:
         name = 'N/A'
         population = '0 M'
         delta = '0 K'
         losses_md = ""+name+"  \n<span style='font-size:2.0em;'>"+population+"</span>  \n<span style='color:black'>&harr;"+delta+"</span>"
         return losses_md
     else:
-        name = input_df.states.iloc[-1]
-        population = format_number(input_df.population.iloc[-1])
-        delta = format_number(input_df.difference.iloc[-1])
+        name, population, delta = extremes[1]
+        population = format_number(population)
+        delta = format_number(delta)
         if delta[0] != '-':
             losses_md = ""+name+"  \n<span style='font-size:2.0em;'>"+population+"</span>  \n<span style='color:green'>&uarr;"+delta+"</span>"
         else:
@@ -108,6 +109,8 @@ def make_losses(input_df, input_year):
 
 # Donut chart
 def make_donut(input_value, input_text, option):
+  import altair as alt
+
   if option == "above":
       chart_color = ['#27AE60', '#12783D']
   else:
@@ -133,6 +136,8 @@ def make_donut(input_value, input_text, option):
 
 # Choropleth map
 def make_choropleth(input_df, input_id, input_column, input_color_theme):
+    import plotly.express as px
+
     choropleth = px.choropleth(input_df, locations=input_id, color=input_column, 
                             locationmode="USA-states", color_continuous_scale=input_color_theme,
                             range_color=(min(input_df.population), max(input_df.population)),
@@ -145,13 +150,17 @@ def make_choropleth(input_df, input_id, input_column, input_color_theme):
     return choropleth
 
 # Heatmap
-def make_heatmap(input_df, input_y, input_x, input_color, input_color_theme, width, height, **kwargs):
+def make_heatmap(input_df, input_y, input_x, input_color, input_color_theme, width, height, scheme_param=None, **kwargs):
+    import altair as alt
+
+    # With scheme_param the color scheme is read from a signal of that name
+    scheme = input_color_theme if scheme_param is None else alt.ExprRef(scheme_param)
     heatmap = alt.Chart(input_df).mark_rect().encode(
             y=alt.Y(f'{input_y}:O', axis=alt.Axis(title="", titleFontSize=18, titlePadding=15, titleFontWeight=900, labelAngle=0)),
             x=alt.X(f'{input_x}:O', axis=alt.Axis(title="", titleFontSize=18, titlePadding=15, titleFontWeight=900)),
             color=alt.Color(f'max({input_color}):Q',
                              legend=None,
-                             scale=alt.Scale(scheme=input_color_theme)),
+                             scale=alt.Scale(scheme=scheme)),
             stroke=alt.value('black'),
             strokeWidth=alt.value(0.25),
         ).properties(
@@ -161,88 +170,297 @@ def make_heatmap(input_df, input_y, input_x, input_color, input_color_theme, wid
         labelFontSize=12,
         titleFontSize=12
         )
+    if scheme_param is not None:
+        heatmap = heatmap.add_params(alt.param(name=scheme_param, value=input_color_theme))
     return heatmap
     
 # Line
 def make_line(input_years, input_population, width, height, dpi, pixelRatio, **kwargs):
-    w = (width - 10)/dpi
-    h = (height - 5)/dpi
-    plt.figure(figsize=(w,h),layout="compressed")
-    plt.plot(np.asarray(input_years, int), np.asarray(input_population, int))
-    fig = plt.gcf()
-    ax = plt.gca()
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figure_size(width, height, dpi), layout="compressed")
+    ax = fig.add_subplot()
+    ax.plot(np.asarray(input_years, int), np.asarray(input_population, int))
     ax.set_xticks([])
     return fig
 
-# Top 5
-def make_top5(input_df):
-    np_input = input_df.to_numpy()
-    top5 = []
-    population_max = float(max(input_df['population']))
-    population_min = float(min(input_df['population']))
-    if abs(population_min) > population_max:
-        population_max = abs(population_min)
-    for i in range(0, 5):
-        percent = round(100*float(np_input[i][5])/population_max)
-        top5.append({'state': np_input[i][1], 
-                     'population': percent, 
-                     'rank': i
-                    }
-                   )
-    return top5
-
-# Bottom 5
-def make_bottom5(input_df):
-    df_reverse_rows = input_df.iloc[::-1]
-    np_input = df_reverse_rows.to_numpy()
-    bottom5 = []
-    population_max = float(max(input_df['population']))
-    population_min = float(min(input_df['population']))
-    if abs(population_min) > population_max:
-        population_max = abs(population_min)    
-    for i in range(0, 5):
-        percent = round(100*float(np_input[i][5])/population_max)
-        bottom5.append({'state': np_input[i][1], 
-                        'population': percent, 
-                        'rank': i
-                       }
-                      )
-    return bottom5
+# Cached chart payloads shared by every session of the process
+def render_donut(input_value, input_text, option):
+    return render_cache.get_or_render(('donut', input_value, input_text, option),
+                                      lambda: specs.donut(input_value, input_text, option))
+
+# The choropleth figure is built once per dataset, selections and themes only patch its trace
+def render_choropleth_skeleton(input_store):
+    input_key = input_store.keys[0]
+    return render_cache.get_or_render(('choropleth_skeleton', input_store.token),
+                                      lambda: choropleth.skeleton(plotly.Figure.to_data(
+                                          make_choropleth(input_store.select(input_key), 'states_code',
+                                                          'population', color_theme_list[0]))))
+
+def render_choropleth_patch(input_store, input_key, input_color_theme):
+    locations = render_choropleth_skeleton(input_store)['data'][0]['locations']
+    return render_cache.get_or_render(('choropleth_patch', input_store.token, input_key, input_color_theme),
+                                      lambda: choropleth.patch(input_store, input_key, input_color_theme, locations))
+
+# A year range is drawn as the change of each state over the range
+def render_choropleth_range_patch(input_store, input_span, input_color_theme):
+    locations = render_choropleth_skeleton(input_store)['data'][0]['locations']
+    input_key = metrics_cube.range_key(input_span.start, input_span.end)
+
+    def render():
+        values = input_span.values['difference'][input_store.state_codes(input_span.end)]
+        return choropleth.patch(input_store, input_span.end, input_color_theme, locations, values=values)
+    return render_cache.get_or_render(('choropleth_patch', input_store.token, input_key, input_color_theme), render)
+
+def render_heatmap(input_store, input_color_theme, width, height, **kwargs):
+    width, height = int(width), int(height)
+    return render_cache.get_or_render(('heatmap', input_store.token, input_color_theme, width, height),
+                                      lambda: specs.heatmap(input_store.select(*input_store.years),
+                                                            input_color_theme, width, height))
+
+# Incremental heatmap: the spec reads a named dataset and takes the color scheme,
+# width and height as signals, so it is only sent once per session
+def render_heatmap_template(input_name, input_color_theme, width, height, **kwargs):
+    width, height = int(width), int(height)
+    return render_cache.get_or_render(('heatmap_template', input_name, input_color_theme, width, height),
+                                      lambda: specs.heatmap({'name': input_name}, input_color_theme, width, height,
+                                                            scheme_param='colorScheme'))
+
+def heatmap_values(input_store):
+    def records():
+        df_years = input_store.select(*input_store.years)
+        return [{'year': year, 'states': state, 'population': int(population)}
+                for year, state, population in zip(df_years.year.astype(str),
+                                                   df_years.states.astype(str),
+                                                   df_years.population)]
+    return render_cache.get_or_render(('heatmap_values', input_store.token), records)
+
+def heatmap_signals(input_color_theme, width, height, **kwargs):
+    return {'colorScheme': input_color_theme, 'width': int(width-60), 'height': int(height-130)}
+
+# Ranking table titles and headers
+def ranking_titles(metric, k):
+    suffix = "" if metric == "population" else f" by {metric.capitalize()}"
+    return f"### Top {k} States{suffix}", f"### Bottom {k} States{suffix}"
+
+def ranking_headers(metric):
+    return [dict(header, title=metric.capitalize()) if header['key'] == 'population' else header
+            for header in table_headers]
+
+# Largest number of ranked states offered by the drawer slider
+RANKING_K_MAX = 15
+
+# Panel payloads rendered live from the population store
+class DashboardRenderer:
+    def __init__(self, store):
+        self.store = store
+        self.ranking = RankingEngine(store)
+        self.metrics = self.ranking.metrics
+        self.cube = self.ranking.cube
+        # Axes come from the data, components first as in the selector
+        self.keys = store.components + store.years
+        self.years = store.years
+        self.population = store.totals(self.years)
+        self.panels = {
+            "title": self.panel_population_title,
+            "donuts": self.panel_donuts,
+            "choropleth": self.panel_choropleth,
+            "gains_losses": self.panel_gains_losses,
+            "top_bottom_5": self.panel_top_bottom_5,
+        }
+
+    # Swap in a reloaded store, only the totals of the touched years are summed again
+    def reload(self, change):
+        store = change.store
+        if store is self.store:
+            return  # already applied by another app sharing this renderer
+        self.store = store
+        self.ranking = change.ranking
+        self.metrics = self.ranking.metrics
+        self.cube = self.ranking.cube
+        self.keys = store.components + store.years
+        if change.axes_changed:
+            self.years = store.years
+            self.population = store.totals(self.years)
+        else:
+            self.population = [int(store.population(year).sum()) if year in change.years else total
+                               for year, total in zip(self.years, self.population)]
+
+    # Selection snapshot, its panels read the precomputed metrics cube
+    def make_selection(self, key, theme, metric="population", k=5):
+        return SimpleNamespace(key=key, theme=theme, metric=metric, k=k)
+
+    # Panel builders only read the selection snapshot so they can run off the event loop
+    def panel_population_title(self, selection):
+        span = self.cube.span(selection.key)
+        if span is not None:
+            sign = "+" if span.total_change >= 0 else ""
+            return "### Population "+span.start+" to "+span.end+" ("+sign+format_number(span.total_change)+")"
+        return "### Population "+selection.key
+
+    def panel_top_bottom_5(self, selection):
+        top, bottom, metric = self.ranking.rank(selection.key, selection.metric, selection.k)
+        return top, bottom, metric, selection.k
+
+    def panel_gains_losses(self, selection):
+        return (make_gains(self.cube, selection.key),
+                make_losses(self.cube, selection.key))
+
+    def panel_donuts(self, selection):
+        states_above, states_below = self.cube.threshold_percentages(selection.key)
+        return render_donut(states_above, 'Above', 'above'), render_donut(states_below, 'Below', 'below')
+
+    def panel_choropleth(self, selection):
+        span = self.cube.span(selection.key)
+        if span is not None:
+            return selection.key, selection.theme, render_choropleth_range_patch(self.store, span, selection.theme)
+        return selection.key, selection.theme, render_choropleth_patch(self.store, selection.key, selection.theme)
+
+    def choropleth_skeleton(self):
+        return render_choropleth_skeleton(self.store)
+
+    def heatmap(self, theme, size):
+        return render_heatmap(self.store, theme, **size)
+
+    def heatmap_template(self, theme, size):
+        return render_heatmap_template("population", theme, **size)
+
+    def heatmap_values(self):
+        return heatmap_values(self.store)
+
+    def line_view(self):
+        return LineView(self.years, self.population)
 
 @TrameApp()
 class MyTrameApp:
-    def __init__(self, server=None):
+    def __init__(self, server=None, data_path=None, profiler=None, defer_render=False, render_delay=None,
+                 heatmap_mode=None, export_dir=None, metrics=None, diagnostics=False, watch=False,
+                 renderer=None, template_name="main"):
         self.server = get_server(server, client_type="vue3")
+        self.template_name = template_name
+        self.profiler = profiler or profiling.disabled
+        watch_interval = data_reload.INTERVAL
+        if data_path is None or render_delay is None or heatmap_mode is None:
+            args = self._cli_args()
+            data_path = args.data if data_path is None else data_path
+            render_delay = args.render_delay if render_delay is None else render_delay
+            heatmap_mode = args.heatmap_mode if heatmap_mode is None else heatmap_mode
+            export_dir = args.serve_export if export_dir is None else export_dir
+            diagnostics = diagnostics or args.diagnostics
+            watch = watch or args.watch
+            watch_interval = args.watch_interval
+            if metrics is None and (args.metrics or args.diagnostics):
+                metrics = instrumentation.Metrics()
+        self.heatmap_mode = heatmap_mode
+        self.diagnostics = diagnostics
+        self.metrics = metrics or (instrumentation.Metrics() if diagnostics else instrumentation.disabled)
+        if self.metrics.enabled:
+            self.ctrl.on_server_bind.add(self.metrics.add_route)
+        self.scheduler = RenderScheduler(delay=render_delay)
+        self.pipeline = PanelPipeline()
+        # The views and state changes of each user action go out in a single flush
+        self.transactions = Transactions(self.state)
 
-        self.state.selectedComponentOrYear = "2011"
         self.state.selectedColorTheme = 'blues'
         self.line = None
+        self.selection = None
+        self.heatmap_serial = 0
+        self.heatmap_edits = {}
+        self.choropleth_skeleton_key = None
+        self.state.choropleth_patch = None
+        self.state.heatmap_spec = None
+
+        # Serving from an export answers every interaction with pre-rendered payloads,
+        # a given renderer is shared with other apps of the process
+        with self.profiler.phase("load data"):
+            if renderer is not None:
+                self.renderer = renderer
+            elif export_dir is None:
+                self.renderer = DashboardRenderer(load_store(data_path))
+            else:
+                from .export import ExportedDashboard
+                self.renderer = ExportedDashboard(export_dir)
+        self.store = self.renderer.store
+        self.ranking = self.renderer.ranking
+        self.panels = {name: self.metrics.timed_panel(name, build)
+                       for name, build in dict(self.renderer.panels, choropleth=self.panel_choropleth).items()}
+        self.state.ranking_metric = "population"
+        self.state.ranking_k = 5
+        self.state.ranking_metrics = self.renderer.metrics
+
+        self.years = self.renderer.years
+        self.population = self.renderer.population
+        # Start on the first year that has a year-over-year difference
+        self.state.selectedComponentOrYear = self.default_key()
+        # Range mode selects the years from range_start to range_end instead
+        self.state.range_mode = False
+        self.reset_range()
+
+        # Data reloads are shared by every app watching the same file
+        self.watcher = None
+        self.watch = watch and self.store is not None
+        if self.watch:
+            self.watcher = data_reload.watch(data_path, self.store, watch_interval)
+            self.watcher.subscribe(self.apply_data_change)
+            self.ctrl.on_server_ready.add(self.start_watching)
 
-        self.df_raw = pandas.read_csv('data/us-population.csv')
-        self.df_years = self.df_raw[self.df_raw.year.str.contains('20')]
-
-        self.years = years
-        self.population = []
-        self.population_labels = []
-        for i in range(2010,2020):
-            year = str(i)
-            df_time = self.df_raw[self.df_raw.year == year]
-            total = df_time['population'].sum()
-            self.population.append(int(total))
- 
         if self.server.hot_reload:
             self.ctrl.on_server_reload.add(self._build_ui)
-        self.ui = self._build_ui()
+        with self.profiler.phase("build ui"):
+            self.ui = self._build_ui()
 
         # Set state variable
         self.state.trame__title = "US Population"
 
-        self.update_population_title()
-        self.calculate_dataframes()
-        self.update_donuts()
-        self.update_choropleth()
-        self.update_gains_losses()
-        self.update_top_bottom_5()
+        # When deferred, the first render happens once the server is bound and the
+        # initial selection is flushed to the change listeners
+        if not defer_render:
+            self.render_selection()
+
+    # Render every panel for the current selection, concurrently when the server loop runs
+    def render_selection(self):
+        key, theme = self.selected_key(), self.state.selectedColorTheme
+        metric, k = self.state.ranking_metric, self.state.ranking_k
+
+        def prepare():
+            with self.profiler.first("calculate_dataframes"):
+                return self.make_selection(key, theme, metric, k)
+
+        with self.transactions.join():
+            self.transactions.track(self.pipeline.run(prepare, self.panels, self.apply_panel,
+                                                      prepared=self.set_selection))
+
+    def _cli_args(self):
+        self.add_arguments(self.server.cli)
+        args, _ = self.server.cli.parse_known_args()
+        return args
+
+    @staticmethod
+    def add_arguments(parser):
+        try:
+            parser.add_argument("--data", default=DEFAULT_DATA,
+                                help="Population CSV (a converted .store next to it is used when fresh)")
+            parser.add_argument("--profile-startup", action="store_true",
+                                help="Print where import, init and first render time goes")
+            parser.add_argument("--render-delay", type=float, default=0.1,
+                                help="Seconds to coalesce heatmap/line resize renders (default: 0.1)")
+            parser.add_argument("--heatmap-mode", choices=["inline", "incremental"], default="inline",
+                                help="incremental: send the heatmap data once and patch theme/size "
+                                     "through Vega signals (needs the built vue-components)")
+            parser.add_argument("--serve-export", metavar="DIR", default=None,
+                                help="Serve the payloads pre-rendered by --export instead of "
+                                     "computing them")
+            parser.add_argument("--metrics", action="store_true",
+                                help="Record handler/render times and payload sizes, served in the "
+                                     "Prometheus text format on /metrics")
+            parser.add_argument("--diagnostics", action="store_true",
+                                help="Like --metrics, plus an in-app diagnostics drawer")
+            parser.add_argument("--watch", action="store_true",
+                                help="Reload the data when its file changes and update connected sessions")
+            parser.add_argument("--watch-interval", type=float, default=data_reload.INTERVAL,
+                                help=f"Seconds between data file checks (default: {data_reload.INTERVAL})")
+        except argparse.ArgumentError:
+            pass  # already registered by another app on this server
 
     @property
     def state(self):
@@ -252,93 +470,254 @@ class MyTrameApp:
     def ctrl(self):
         return self.server.controller
 
+    def push_view(self, name, payload):
+        self.metrics.payload(name, payload)
+        self.transactions[self.views[name].key] = payload
+
     @controller.set("reset_resolution")
     def reset_resolution(self):
         self.state.resolution = 6
 
-    def calculate_dataframes(self):
-        self.df_selected_cmp_or_yr = self.df_raw[self.df_raw.year == self.state.selectedComponentOrYear]
-        self.df_selected_sorted = self.df_selected_cmp_or_yr.sort_values(by="population", ascending=False)
-        self.df_difference_sorted = calculate_population_difference(self.df_raw, self.state.selectedComponentOrYear)
+    def make_selection(self, key, theme, metric="population", k=5):
+        return self.renderer.make_selection(key, theme, metric, k)
+
+    def default_key(self):
+        return self.years[1] if len(self.years) > 1 else self.renderer.keys[0]
+
+    # Selection key: the year/component, or the year range key in range mode
+    def selected_key(self):
+        if self.store is not None and self.state.range_mode:
+            key = metrics_cube.range_key(self.state.range_start, self.state.range_end)
+            if key in self.renderer.cube:
+                return key
+        return self.state.selectedComponentOrYear
+
+    def reset_range(self):
+        self.state.range_years = self.years
+        if self.state.range_start not in self.years or self.state.range_end not in self.years:
+            self.state.range_start = self.years[0] if self.years else None
+            self.state.range_end = self.years[-1] if self.years else None
+
+    def set_selection(self, selection):
+        self.selection = selection
+
+    def panel_choropleth(self, selection):
+        with self.profiler.first("first choropleth render"):
+            return self.renderer.panel_choropleth(selection)
+
+    def apply_panel(self, name, result):
+        with self.transactions.join():
+            if name == "title":
+                self.push_view("title", result)
+            elif name == "donuts":
+                self.push_view("above", result[0])
+                self.push_view("below", result[1])
+            elif name == "choropleth":
+                key, theme, payload = result
+                if (key, theme) != (self.selected_key(), self.state.selectedColorTheme):
+                    return  # superseded by a newer selection or theme
+                # The skeleton goes out once per view, then only trace patches
+                if self.choropleth_skeleton_key != self.views["choropleth"].key:
+                    self.push_view("choropleth", self.renderer.choropleth_skeleton())
+                    self.choropleth_skeleton_key = self.views["choropleth"].key
+                self.metrics.payload("choropleth_patch", payload)
+                self.transactions.update(choropleth_patch=payload, figure_ready=True)
+            elif name == "gains_losses":
+                self.push_view("gains", result[0])
+                self.push_view("losses", result[1])
+            elif name == "top_bottom_5":
+                top5, bottom5, metric, k = result
+                top_title, bottom_title = ranking_titles(metric, k)
+                self.transactions.update(top5=top5, bottom5=bottom5, ranking_top_title=top_title,
+                                         ranking_bottom_title=bottom_title, table_headers=ranking_headers(metric))
+
+    def update_panel(self, name):
+        with self.metrics.callback(f"update_{name}"):
+            self.apply_panel(name, self.panels[name](self.selection))
 
     def update_population_title(self):
-        self.ctrl.population_md.update("### Population "+self.state.selectedComponentOrYear)
+        self.update_panel("title")
 
     def update_top_bottom_5(self):
-        self.state.top5 = make_top5(self.df_selected_sorted)
-        self.state.bottom5 = make_bottom5(self.df_selected_sorted)
+        self.update_panel("top_bottom_5")
 
     def update_gains_losses(self):
-        self.ctrl.gains_md.update(make_gains(self.df_difference_sorted, self.state.selectedComponentOrYear))
-        self.ctrl.losses_md.update(make_losses(self.df_difference_sorted, self.state.selectedComponentOrYear))
+        self.update_panel("gains_losses")
 
     def update_donuts(self):
-        if (self.state.selectedComponentOrYear in components_2010):
-            states_above = 0
-            states_below = 0
-            donut_above = make_donut(states_above, 'Above', 'above')
-            donut_below = make_donut(states_below, 'Below', 'below')
-        else:
-            df_greater_50000 = self.df_difference_sorted[self.df_difference_sorted.difference > 50000]
-            df_less_50000 = self.df_difference_sorted[self.df_difference_sorted.difference < -50000]
-            states_above = round((len(df_greater_50000)/self.df_difference_sorted.states.nunique())*100)
-            states_below = round((len(df_less_50000)/self.df_difference_sorted.states.nunique())*100)
-            donut_above = make_donut(states_above, 'Above', 'above')
-            donut_below = make_donut(states_below, 'Below', 'below')
-        self.ctrl.above_view_update(donut_above)
-        self.ctrl.below_view_update(donut_below)
-    
+        self.update_panel("donuts")
+
     def update_choropleth(self):
-        choropleth = make_choropleth(self.df_selected_cmp_or_yr, 'states_code', 'population', self.state.selectedColorTheme)
-        self.ctrl.choropleth_view_update(choropleth)
-        self.state.figure_ready = True
+        self.update_panel("choropleth")
 
     def update_heatmap(self):
         self.update_heatmap_size(self.state.heatmap_size)
 
+    # Push a payload rendered by the scheduler, with the other changes of its user action
+    def apply_view(self, name, payload):
+        with self.transactions.join():
+            self.push_view(name, payload)
+
     @change("heatmap_size")
+    @instrumented
     def update_heatmap_size(self, heatmap_size, **kwargs):
         if heatmap_size is None:
             return
-        heatmap = make_heatmap(self.df_years, 'year', 'states', 'population', self.state.selectedColorTheme, **heatmap_size.get("size"))
-        self.server.controller.heatmap_view_update(heatmap)
+        theme, size = self.state.selectedColorTheme, heatmap_size.get("size")
+        if self.heatmap_mode == "incremental":
+            self.update_heatmap_signals(theme, size)
+            return
+
+        def render():
+            with self.profiler.first("first heatmap render"), self.metrics.render("heatmap"):
+                return self.renderer.heatmap(theme, size)
+
+        # Debounced resize renders go out on their own, not holding the action they come from
+        with self.transactions.action():
+            self.transactions.track(
+                self.scheduler.schedule("heatmap", render, lambda payload: self.apply_view("heatmap", payload)))
+
+    # Incremental heatmap: spec and data go out once, then only signal patches
+    def update_heatmap_signals(self, theme, size):
+        if self.state.heatmap_spec is None:
+            with self.profiler.first("first heatmap render"):
+                self.state.heatmap_spec = self.renderer.heatmap_template(theme, size)
+                self.state.heatmap_values = self.renderer.heatmap_values()
+                self.state.heatmap_changes = None
+                self.heatmap_edits = {}
+        self.transactions["heatmap_signals"] = heatmap_signals(theme, **size)
+
+    # Insert/remove heatmap rows on the client, rows are matched on (states, year).
+    # Changes accumulate since heatmap_values was sent, so a view mounted later
+    # can replay them and re-applying them is harmless.
+    def patch_heatmap_data(self, insert=(), remove=()):
+        if self.heatmap_mode != "incremental" or self.state.heatmap_spec is None:
+            return
+        for row in remove:
+            self.heatmap_edits[(row["states"], row["year"])] = None
+        for row in insert:
+            self.heatmap_edits[(row["states"], row["year"])] = row
+        self.heatmap_serial += 1
+        self.transactions["heatmap_changes"] = {
+            "insert": [row for row in self.heatmap_edits.values() if row is not None],
+            "remove": [{"states": states, "year": year} for states, year in self.heatmap_edits],
+            "serial": self.heatmap_serial,
+        }
 
     @change("line_size")
+    @instrumented
     def update_line_size(self, line_size, **kwargs):
-        if self.line != None:
-                plt.close(self.line)
         if line_size is None:
-            self.line = make_line(self.years, self.population, 300, 300, 192, 2)
-            self.server.controller.line_view_update(self.line)
-            return
-        size = line_size.get("size")
-        width = size.get("width")
-        height = size.get("height")
-        dpi = line_size.get("dpi")
-        pixelRatio = line_size.get("pixelRatio")
-        self.line = make_line(self.years, self.population, width, height, dpi, pixelRatio)
-        self.server.controller.line_view_update(self.line)
+            width, height, dpi, pixelRatio = 300, 300, 192, 2
+        else:
+            size = line_size.get("size")
+            width = size.get("width")
+            height = size.get("height")
+            dpi = line_size.get("dpi")
+            pixelRatio = line_size.get("pixelRatio")
+
+        if self.line is None:
+            self.line = self.renderer.line_view()
+        line = self.line
+
+        def render():
+            with self.profiler.first("first line render"), self.metrics.render("line"):
+                return line.render(width, height, dpi, pixelRatio)
+
+        with self.transactions.action():
+            self.transactions.track(
+                self.scheduler.schedule("line", render, lambda payload: self.apply_view("line", payload)))
 
     @change("selectedComponentOrYear")
+    @instrumented
     def on_component_or_year_change(self, selectedComponentOrYear, **kwargs):
-        self.update_population_title()
-        self.calculate_dataframes()
-        self.update_donuts()
-        self.update_choropleth()
-        self.update_gains_losses()
-        self.update_top_bottom_5()
+        self.render_selection()
+
+    @change("range_mode", "range_start", "range_end")
+    @instrumented
+    def on_range_change(self, **kwargs):
+        if self.selection is not None and self.selection.key == self.selected_key():
+            return  # e.g. the bounds moved while range mode is off
+        self.render_selection()
+
+    @change("ranking_metric", "ranking_k")
+    @instrumented
+    def on_ranking_change(self, ranking_metric, ranking_k, **kwargs):
+        if self.selection is None:
+            return
+        selection = SimpleNamespace(**{**vars(self.selection), "metric": ranking_metric, "k": int(ranking_k)})
+        self.selection = selection
+        with self.transactions.join():
+            self.transactions.track(
+                self.scheduler.schedule("ranking", lambda: self.panels["top_bottom_5"](selection),
+                                        lambda result: self.apply_panel("top_bottom_5", result), delay=0))
 
     @change("selectedColorTheme")
+    @instrumented
     def on_color_change(self, selectedColorTheme, **kwargs):
-        self.update_choropleth()
-        self.update_heatmap()
+        if self.selection is not None:
+            self.selection = SimpleNamespace(**{**vars(self.selection), "theme": selectedColorTheme})
+        selection = SimpleNamespace(key=self.selected_key(), theme=selectedColorTheme)
+        with self.transactions.join():
+            self.transactions.track(
+                self.scheduler.schedule("choropleth", lambda: self.panels["choropleth"](selection),
+                                        lambda result: self.apply_panel("choropleth", result), delay=0))
+            self.update_heatmap()
+
+    def start_watching(self, **kwargs):
+        self.watcher.start()
+
+    # Reloaded data: only the panels and views depending on the changed keys are rendered again
+    @instrumented
+    def apply_data_change(self, change):
+        self.renderer.reload(change)
+        self.store = self.renderer.store
+        self.ranking = self.renderer.ranking
+        self.years = self.renderer.years
+        self.population = self.renderer.population
+        if change.skeleton_changed:
+            self.choropleth_skeleton_key = None
+
+        key = self.selected_key()
+        # The notice goes out with the panels rendered again
+        with self.transactions.join():
+            self.state.component_year = self.renderer.keys
+            self.state.ranking_metrics = self.renderer.metrics
+            self.state.data_reload_message = f"Data updated: {len(change.rows)} values changed"
+            self.state.data_reload_open = True
+            self.reset_range()
+            if self.state.selectedComponentOrYear not in self.renderer.keys:
+                self.state.selectedComponentOrYear = self.default_key()  # renders the new selection
+            if self.state.ranking_metric not in self.renderer.metrics:
+                self.state.ranking_metric = "population"
+
+            if key == self.selected_key() and (change.affects(key) or self.state.ranking_metric in change.keys):
+                self.render_selection()
+            if change.years:
+                if self.line is not None:
+                    self.line.set_data(self.years, self.population)
+                    self.update_line_size(self.state.line_size)
+                if self.heatmap_mode == "incremental":
+                    self.patch_heatmap_data(*change.heatmap_changes())
+                else:
+                    self.update_heatmap()
+
+    # Diagnostics drawer, only refreshed while it is open
+    @change("diagnostics_open")
+    def refresh_diagnostics(self, diagnostics_open=True, **kwargs):
+        if diagnostics_open and self.diagnostics:
+            self.state.diagnostics = self.metrics.summary()
 
     def _build_ui(self, *args, **kwargs):
-        with SinglePageWithDrawerLayout(self.server) as layout:
+        self.views = {}
+        with SinglePageWithDrawerLayout(self.server, template_name=self.template_name) as layout:
             # Toolbar
             layout.title.set_text("&#x1f1fa;&#x1f1f8; US Population")
             with layout.toolbar:
                 vuetify3.VSpacer()
+                if self.diagnostics:
+                    vuetify3.VBtn(icon="mdi-speedometer", variant="text",
+                                  click="diagnostics_open = !diagnostics_open")
             # Drawer content
             with layout.drawer:
                 with vuetify3.VRow(classes="px-2 py-2", style="font-size: 40px; font-weight:bold;",
@@ -349,12 +728,43 @@ class MyTrameApp:
                     with vuetify3.VCol(cols="12"):
                         vuetify3.VSelect(
                             v_model=("selectedComponentOrYear", "Change"),
-                            items=("component_year", component_or_year),
+                            items=("component_year", self.renderer.keys),
                             label="Select data component or year",
+                            disabled=("range_mode",),
                             dense=True,
                             hide_details=True,
                             outlined=True,
                         )
+                # Year ranges are computed live, so they are not offered when serving an export
+                if self.store is not None:
+                    with vuetify3.VRow(classes="px-0 py-0", dense=True, hide_details=True):
+                        with vuetify3.VCol(cols="12"):
+                            vuetify3.VSwitch(
+                                v_model=("range_mode", False),
+                                label="Select a range of years",
+                                color="primary",
+                                density="compact",
+                                hide_details=True,
+                            )
+                    with vuetify3.VRow(classes="px-0 py-2", dense=True, hide_details=True, v_show=("range_mode",)):
+                        with vuetify3.VCol(cols="6"):
+                            vuetify3.VSelect(
+                                v_model=("range_start",),
+                                items=("range_years.filter(year => year < range_end)",),
+                                label="From",
+                                dense=True,
+                                hide_details=True,
+                                outlined=True,
+                            )
+                        with vuetify3.VCol(cols="6"):
+                            vuetify3.VSelect(
+                                v_model=("range_end",),
+                                items=("range_years.filter(year => year > range_start)",),
+                                label="To",
+                                dense=True,
+                                hide_details=True,
+                                outlined=True,
+                            )
                 with vuetify3.VRow(classes="px-0 py-5", dense=True, hide_details=True):
                     with vuetify3.VCol(cols="12"):
                         vuetify3.VSelect(
@@ -365,6 +775,27 @@ class MyTrameApp:
                             hide_details=True,
                             outlined=True,
                         )
+                with vuetify3.VRow(classes="px-0 py-5", dense=True, hide_details=True):
+                    with vuetify3.VCol(cols="12"):
+                        vuetify3.VSelect(
+                            v_model=("ranking_metric", "population"),
+                            items=("ranking_metrics",),
+                            label="Rank states by",
+                            dense=True,
+                            hide_details=True,
+                            outlined=True,
+                        )
+                with vuetify3.VRow(classes="px-0 py-5", dense=True, hide_details=True):
+                    with vuetify3.VCol(cols="12"):
+                        vuetify3.VSlider(
+                            v_model=("ranking_k", 5),
+                            min=1,
+                            max=RANKING_K_MAX,
+                            step=1,
+                            label="Ranked states",
+                            thumb_label=True,
+                            hide_details=True,
+                        )
                 with vuetify3.VRow(classes="px-2 py-5", dense=True, hide_details=True):
                     about_md = markdown.Markdown(about_content)
             # Main content
@@ -379,10 +810,10 @@ class MyTrameApp:
                                     markdown.Markdown("""### Population over time""")
                             with vuetify3.VRow(classes="pa-0, px-2", style="height: 40%;",):
                                 with trame.SizeObserver("line_size"):
-                                    line_view = matplotlib.Figure(
+                                    line_view = MatplotlibFigure(
                                         figure=None
                                         )
-                                    self.ctrl.line_view_update = line_view.update
+                                    self.views["line"] = line_view
                             with vuetify3.VRow(classes="pa-0 py-4",dense=True, hide_details=True):
                                 with vuetify3.VCol(cols="12"):
                                     markdown.Markdown("""### Gains/Losses""")
@@ -390,10 +821,12 @@ class MyTrameApp:
                                 with vuetify3.VCol(cols="12", classes="pa-0 px-8"):
                                     gains_md = markdown.Markdown("#### -\n### -\n#### -")
                                     self.server.controller.gains_md.update = gains_md.update
+                                    self.views["gains"] = gains_md
                             with vuetify3.VRow(classes="pa-0",dense=True, hide_details=True):
                                 with vuetify3.VCol(cols="12", classes="pa-0 px-8 py-4"):
                                     losses_md = markdown.Markdown("#### -\n### -\n#### -")
                                     self.server.controller.losses_md.update = losses_md.update
+                                    self.views["losses"] = losses_md
                             with vuetify3.VRow(classes="pa-0",dense=True, hide_details=True):
                                 with vuetify3.VCol(cols="12"):
                                     markdown.Markdown("""### States Growth""")
@@ -403,34 +836,49 @@ class MyTrameApp:
                                         markdown.Markdown("Above")
                                     with vuetify3.VRow(classes="pa-0 px-4",style="height: 40%;",):
                                         above_view = vega.Figure(style="width: 100%;")
-                                        self.ctrl.above_view_update = above_view.update
+                                        self.views["above"] = above_view
                                 with vuetify3.VCol(cols="6"):
                                     with vuetify3.VRow(classes="pa-0 px-4"):
                                         markdown.Markdown("Below")
                                     with vuetify3.VRow(classes="pa-0 px-4",style="height: 40%;",):
                                         below_view = vega.Figure(style="width: 100%;")
-                                        self.ctrl.below_view_update = below_view.update
+                                        self.views["below"] = below_view
                         with vuetify3.VCol(cols=6, classes="pa-0"):
                             with vuetify3.VRow(classes="pa-0",dense=True, hide_details=True):
                                 with vuetify3.VCol(cols="12"):
                                     population_md = markdown.Markdown("### Population")
                                     self.ctrl.population_md.update = population_md.update
+                                    self.views["title"] = population_md
                             with vuetify3.VRow(classes="pa-0", style="height: 40%;",):
-                                self.server.controller.choropleth_view_update = plotly.Figure(
+                                choropleth_view = plotly.Figure(
                                             display_mode_bar=("false",),
                                             v_show=("figure_ready", False),
-                                            ).update
+                                            )
+                                # Trace attributes of the selection are merged into the skeleton trace
+                                choropleth_view.data = (f"[{{ ...{choropleth_view.key}.data[0], ...choropleth_patch }}]",)
+                                self.views["choropleth"] = choropleth_view
                             with vuetify3.VRow(classes="pa-0",dense=True, hide_details=True):
                                 with vuetify3.VCol(cols="12"):
                                     markdown.Markdown("""### Heatmap""")
                             with vuetify3.VRow(classes="pa-0",style="height: 40%;",):
                                 with trame.SizeObserver("heatmap_size"):
-                                    heatmap_view = vega.Figure(style="width: 100%;")
-                                    self.server.controller.heatmap_view_update = heatmap_view.update
+                                    if self.heatmap_mode == "incremental":
+                                        VegaDataView(
+                                            spec=("heatmap_spec", None),
+                                            dataset="population",
+                                            values=("heatmap_values", None),
+                                            changes=("heatmap_changes", None),
+                                            signals=("heatmap_signals", None),
+                                            key_fields=("heatmap_key_fields", ["states", "year"]),
+                                            style="width: 100%;",
+                                        )
+                                    else:
+                                        heatmap_view = vega.Figure(style="width: 100%;")
+                                        self.views["heatmap"] = heatmap_view
                         with vuetify3.VCol(cols=3, classes="pa-0 px-2",):
                             with vuetify3.VRow(classes="pa-0",dense=True, hide_details=True):
                                 with vuetify3.VCol(cols="12"):
-                                    markdown.Markdown("""### Top 5 States""")
+                                    markdown.Markdown(content=("ranking_top_title", "### Top 5 States"))
                             with vuetify3.VRow(classes="pa-0 px-2",):
                                 with vuetify3.VDataTable(
                                     headers=("table_headers", table_headers), 
@@ -446,7 +894,7 @@ class MyTrameApp:
                                     vuetify3.Template(raw_attrs=["v-slot:bottom"])
                             with vuetify3.VRow(classes="pa-0 px-2",dense=True, hide_details=True):
                                 with vuetify3.VCol(cols="12"):
-                                    markdown.Markdown("""### Bottom 5 States""")
+                                    markdown.Markdown(content=("ranking_bottom_title", "### Bottom 5 States"))
                             with vuetify3.VRow(classes="pa-0 px-2",):
                                 with vuetify3.VDataTable(
                                     headers=("table_headers", table_headers), 
@@ -461,6 +909,35 @@ class MyTrameApp:
                                             with vuetify3.Template(raw_attrs=['v-slot:default="{ value }"']):
                                                 html.Div("<strong>{{Math.round(value)}}%</strong>")
                                     vuetify3.Template(raw_attrs=["v-slot:bottom"])
+            # Data reload notice
+            if self.watch:
+                vuetify3.VSnackbar(
+                    v_model=("data_reload_open", False),
+                    text=("data_reload_message", ""),
+                    timeout=4000,
+                    location="bottom right",
+                )
+            # Diagnostics
+            if self.diagnostics:
+                with vuetify3.VNavigationDrawer(v_model=("diagnostics_open", False), location="right",
+                                                temporary=True, width=560):
+                    with vuetify3.VRow(classes="px-4 py-2", dense=True, hide_details=True):
+                        markdown.Markdown("### Diagnostics")
+                        vuetify3.VSpacer()
+                        vuetify3.VBtn(icon="mdi-refresh", variant="text", size="small",
+                                      click=self.refresh_diagnostics)
+                    vuetify3.VDataTable(
+                        headers=("diagnostics_headers", [
+                            {'title': 'Metric', 'key': 'metric'},
+                            {'title': 'Target', 'key': 'target'},
+                            {'title': 'Count', 'key': 'count'},
+                            {'title': 'Mean', 'key': 'mean'},
+                            {'title': 'p95', 'key': 'p95'},
+                        ]),
+                        items=("diagnostics", []),
+                        items_per_page=-1,
+                        density="compact",
+                    )
             # Footer
             # layout.footer.hide()
 
@@ -0,0 +1,319 @@
+import numpy as np
+
+from .ranking import CHANGE_METRICS, bottom_k, top_k
+
+# Annual change above which, or below minus which, a state counts in the donuts
+THRESHOLD = 50000
+
+# Separator of the start and end years of a range key, e.g. "2012-2017"
+RANGE_SEPARATOR = "-"
+
+# ---------------------------------------------------------
+# Derived metrics cube
+#
+# Every metric the selection panels show is computed once per dataset, as a
+# key x state matrix, in vectorized passes over the whole store:
+#
+#   population  value of each year/component
+#   difference  change over the previous year
+#   growth      difference in percent of the previous year's population
+#
+# together with the descending order of every metric row, its magnitude and
+# the number of states above and below +/-THRESHOLD. A selection change then
+# only indexes rows of these matrices.
+#
+# Year ranges are selected by keys like "2012-2017". Prefix sums of the
+# population over the years make the mean population of any range, per state
+# and nationally, a difference of two rows, so that every range metric is
+# computed in O(states) whatever the length of the range.
+# ---------------------------------------------------------
+
+
+def range_key(start, end):
+    return f"{start}{RANGE_SEPARATOR}{end}"
+
+
+def parse_range(key):
+    """(start, end) years of a range key, None for year and component keys"""
+    start, separator, end = key.partition(RANGE_SEPARATOR)
+    if separator and start.isdigit() and end.isdigit():
+        return start, end
+    return None
+
+
+def range_touches(key, years):
+    """Whether the metrics of the range ``key`` depend on one of ``years``"""
+    start, end = parse_range(key)
+    return any(start <= year <= end for year in years)
+
+
+def _descending(values, valid, missing, rows=slice(None)):
+    """
+    Per row, indices of the valid values largest first, ties in index order.
+    Only ``rows`` are sorted, the others are left at zero.
+    """
+    order = np.zeros(values.shape, dtype=np.int32)
+    order[rows] = np.argsort(
+        np.where(valid[rows], -values[rows], missing), axis=1, kind="stable"
+    )
+    return order
+
+
+def _magnitude(values, valid):
+    return np.max(np.where(valid, np.abs(values), 0), axis=1, initial=0).astype(
+        np.float64
+    )
+
+
+class MetricsCube:
+    def __init__(self, store, threshold=THRESHOLD):
+        self.keys = store.keys
+        self.states = store.states
+        self.threshold = threshold
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        shape = (len(self.keys), len(self.states))
+
+        frame = store.frame
+        key_codes = frame["year"].cat.codes.to_numpy()
+        state_codes = frame["states"].cat.codes.to_numpy()
+        population = np.zeros(shape, dtype=np.int64)
+        population[key_codes, state_codes] = frame["population"].to_numpy()
+        present = np.zeros(shape, dtype=bool)
+        present[key_codes, state_codes] = True
+
+        # Row of the previous year, -1 for components and the first year
+        previous = np.array(
+            [
+                self.index.get(str(int(key) - 1), -1) if key.isdigit() else -1
+                for key in self.keys
+            ],
+            dtype=np.intp,
+        )
+        self.has_previous = previous >= 0
+        before = np.where(self.has_previous[:, None], population[previous], 0)
+        before_present = self.has_previous[:, None] & present[previous]
+
+        # States missing from the previous year count from zero
+        difference = np.where(present, population - before, 0)
+        growth_valid = present & before_present & (before > 0)
+        growth = np.divide(
+            100.0 * difference,
+            before,
+            out=np.zeros(shape, dtype=np.float64),
+            where=growth_valid,
+        )
+        change_valid = present & self.has_previous[:, None]
+
+        self.population = population
+        self.present = present
+        self.counts = present.sum(axis=1)
+        self.values = {
+            "population": population,
+            "difference": difference,
+            "growth": growth,
+        }
+        self.valid = {
+            "population": present,
+            "difference": change_valid,
+            "growth": growth_valid,
+        }
+        self.lengths = {
+            metric: valid.sum(axis=1) for metric, valid in self.valid.items()
+        }
+        largest = np.iinfo(np.int64).max
+        self.order = {
+            "population": _descending(population, present, largest),
+            "difference": _descending(
+                difference, change_valid, largest, self.has_previous
+            ),
+            "growth": _descending(growth, growth_valid, np.inf, self.has_previous),
+        }
+        self.magnitude = {
+            metric: _magnitude(self.values[metric], self.valid[metric])
+            for metric in self.values
+        }
+        self.above = np.sum(change_valid & (difference > threshold), axis=1)
+        self.below = np.sum(change_valid & (difference < -threshold), axis=1)
+
+        # Year axis of the ranges, with prefix sums over it of the population,
+        # of the number of years each state is present and of the totals
+        self.years = store.years
+        self.year_rows = np.array(
+            [self.index[year] for year in self.years], dtype=np.intp
+        )
+        self.year_position = {year: i for i, year in enumerate(self.years)}
+        shape = (len(self.years) + 1, len(self.states))
+        self.prefix = np.zeros(shape, dtype=np.int64)
+        np.cumsum(population[self.year_rows], axis=0, out=self.prefix[1:])
+        self.prefix_count = np.zeros(shape, dtype=np.int64)
+        np.cumsum(present[self.year_rows], axis=0, out=self.prefix_count[1:])
+        self.total_prefix = self.prefix.sum(axis=1)
+        # The panels of a range selection share its span
+        self._last_span = (None, None)
+
+    def __contains__(self, key):
+        return key in self.index or self.span(key) is not None
+
+    def span(self, key):
+        """Span of a range key of this data, None for other keys"""
+        bounds = parse_range(key)
+        if bounds is None:
+            return None
+        start, end = bounds
+        if start not in self.year_position or end not in self.year_position:
+            return None
+        if self.year_position[start] >= self.year_position[end]:
+            return None
+        last_key, span = self._last_span
+        if last_key != key:
+            span = Span(self, start, end)
+            self._last_span = (key, span)
+        return span
+
+    # -----------------------------------------------------
+    # Lookups
+    # -----------------------------------------------------
+
+    def row(self, key, metric="population"):
+        """
+        (metric, row) holding ``metric`` for the ``key`` selection: change
+        metrics fall back to the population for keys without a previous
+        year, a year/component metric reads that key's row.
+        """
+        if metric in self.index:
+            return "population", self.index[metric]
+        i = self.index[key]
+        if metric in CHANGE_METRICS:
+            return (metric if self.has_previous[i] else "population"), i
+        return "population", i
+
+    def ranked(self, key, metric="population"):
+        """State codes sorted by ``metric``, largest first, with the metric row and its magnitude"""
+        metric, i = self.row(key, metric)
+        return (
+            self.order[metric][i, : self.lengths[metric][i]],
+            self.values[metric][i],
+            self.magnitude[metric][i],
+        )
+
+    def extremes(self, key):
+        """
+        (state, population, difference) of the largest gain and of the
+        largest loss of a year, None for keys without a previous year
+        """
+        span = self.span(key)
+        if span is not None:
+            return span.extremes()
+        i = self.index[key]
+        if not self.has_previous[i]:
+            return None
+        order = self.ranked(key, "difference")[0]
+        if not len(order):
+            return None
+        return tuple(
+            (
+                str(self.states[code]),
+                int(self.population[i, code]),
+                int(self.values["difference"][i, code]),
+            )
+            for code in (order[0], order[-1])
+        )
+
+    def threshold_percentages(self, key):
+        """Percentages of the states of a year above +threshold and below -threshold"""
+        span = self.span(key)
+        if span is not None:
+            return span.threshold_percentages()
+        i = self.index[key]
+        if not self.has_previous[i] or not self.counts[i]:
+            return 0, 0
+        count = int(self.counts[i])
+        return (
+            round((int(self.above[i]) / count) * 100),
+            round((int(self.below[i]) / count) * 100),
+        )
+
+
+class Span:
+    """
+    Metrics of the states over the years ``start`` to ``end``:
+
+    - ``population``: mean population over the years of the range
+    - ``difference``: change from ``start`` to ``end``
+    - ``growth``: that change in percent of the ``start`` population
+
+    and the national ``total_change`` and ``total_mean``.
+    """
+
+    def __init__(self, cube, start, end):
+        self.cube = cube
+        self.start = start
+        self.end = end
+        i, j = cube.year_position[start], cube.year_position[end]
+        first, last = cube.year_rows[i], cube.year_rows[j]
+        self.steps = j - i
+        self.last = last
+
+        present = cube.present[last]
+        before = cube.population[first]
+        count = cube.prefix_count[j + 1] - cube.prefix_count[i]
+        mean_valid = count > 0
+        mean = np.divide(
+            cube.prefix[j + 1] - cube.prefix[i],
+            count,
+            out=np.zeros(len(count), dtype=np.float64),
+            where=mean_valid,
+        )
+        # States missing from the start year count from zero
+        difference = np.where(present, cube.population[last] - before, 0)
+        growth_valid = present & cube.present[first] & (before > 0)
+        growth = np.divide(
+            100.0 * difference,
+            before,
+            out=np.zeros(len(before), dtype=np.float64),
+            where=growth_valid,
+        )
+        self.values = {"population": mean, "difference": difference, "growth": growth}
+        self.valid = {
+            "population": mean_valid,
+            "difference": present,
+            "growth": growth_valid,
+        }
+        self.total_change = int(
+            cube.population[last].sum() - cube.population[first].sum()
+        )
+        self.total_mean = (cube.total_prefix[j + 1] - cube.total_prefix[i]) / (
+            j - i + 1
+        )
+
+    def ranked(self, metric):
+        """(state codes, metric values indexed by state code) of ``metric``"""
+        return np.flatnonzero(self.valid[metric]), self.values[metric]
+
+    def extremes(self):
+        """(state, population, change) of the largest gain and of the largest loss"""
+        codes, values = self.ranked("difference")
+        if not len(codes):
+            return None
+        gain = codes[top_k(values[codes], 1)[0]]
+        loss = codes[bottom_k(values[codes], 1)[0]]
+        return tuple(
+            (
+                str(self.cube.states[code]),
+                int(self.cube.population[self.last, code]),
+                int(self.values["difference"][code]),
+            )
+            for code in (gain, loss)
+        )
+
+    def threshold_percentages(self):
+        """Percentages of the states whose mean annual change is above +threshold and below -threshold"""
+        codes, values = self.ranked("difference")
+        if not len(codes):
+            return 0, 0
+        annual = values[codes] / self.steps
+        threshold = self.cube.threshold
+        return (
+            round((int(np.sum(annual > threshold)) / len(codes)) * 100),
+            round((int(np.sum(annual < -threshold)) / len(codes)) * 100),
+        )
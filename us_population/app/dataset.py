@@ -0,0 +1,220 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas
+
+from .ingest import CHUNKSIZE, ingest_csv
+from .store import PopulationStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA = "data/us-population.csv"
+FORMAT_VERSION = 1
+CATEGORICAL_COLUMNS = ["states", "states_code", "year"]
+
+# Stores already loaded by this process, keyed by resolved path
+_loaded = {}
+
+# Directory CSV stores are converted into and mapped from, see share_stores()
+_shared_directory = None
+
+# ---------------------------------------------------------
+# Binary dataset format
+#
+#   <name>.store/
+#       meta.json          format version, source stamp, categories
+#       <column>.npy       one array per column (codes for categoricals)
+#       index.npy          original row labels
+# ---------------------------------------------------------
+
+
+def binary_path(csv_path):
+    return Path(csv_path).with_suffix(".store")
+
+
+def source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_store(csv_path, chunksize=CHUNKSIZE):
+    """Stream ``csv_path`` into a PopulationStore with bounded memory"""
+    return ingest_csv(csv_path, chunksize).to_store()
+
+
+def convert(csv_path, output=None, chunksize=CHUNKSIZE):
+    """Write ``csv_path`` as a memory-mappable columnar store"""
+    csv_path = Path(csv_path)
+    output = Path(output) if output else binary_path(csv_path)
+    return write_binary(read_store(csv_path, chunksize), output, csv_path)
+
+
+def write_binary(store, output, csv_path):
+    """Write ``store``, read from ``csv_path``, in the binary format"""
+    csv_path = Path(csv_path)
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    frame = store.frame
+    categories = {}
+    for name in PopulationStore.columns:
+        column = frame[name]
+        if name in CATEGORICAL_COLUMNS:
+            categories[name] = [str(value) for value in column.cat.categories]
+            values = column.cat.codes.to_numpy()
+        else:
+            values = column.to_numpy()
+        np.save(output / f"{name}.npy", np.ascontiguousarray(values))
+    np.save(output / "index.npy", frame.index.to_numpy(dtype=np.int64))
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "source": {"path": csv_path.name, **source_stamp(csv_path)},
+        "rows": len(frame),
+        "categories": categories,
+    }
+    # meta.json is written last so a partial conversion is never picked up
+    with open(output / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+    return output
+
+
+def is_stale(store_path, csv_path):
+    try:
+        with open(Path(store_path) / "meta.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return True
+    if meta.get("version") != FORMAT_VERSION:
+        return True
+    if not os.path.exists(csv_path):
+        # Binary shipped without its source is used as is
+        return False
+    stamp = meta.get("source", {})
+    return {k: stamp.get(k) for k in ("size", "mtime_ns")} != source_stamp(csv_path)
+
+
+def open_binary(store_path):
+    """Map a converted store without parsing or copying column data"""
+    store_path = Path(store_path)
+    with open(store_path / "meta.json") as f:
+        meta = json.load(f)
+    columns = {
+        name: np.load(store_path / f"{name}.npy", mmap_mode="r")
+        for name in PopulationStore.columns
+    }
+    index = pandas.Index(np.load(store_path / "index.npy", mmap_mode="r"))
+    return PopulationStore.from_columns(columns, meta["categories"], index=index)
+
+
+def share_binary(store, directory, csv_path):
+    """
+    Binary store of ``store`` in the shared ``directory``, written once.
+
+    Processes loading the same data concurrently, e.g. workers reloading a
+    changed file, map the same files: each store is written into a private
+    directory then renamed into place, and one already there is used as is,
+    never rewritten under the processes mapping it. Earlier versions of the
+    file are removed, processes still mapping them keep their pages.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = Path(csv_path).stem
+    output = directory / f"{stem}-{store.token}.store"
+    if not output.exists():
+        partial = Path(tempfile.mkdtemp(prefix=f".{output.name}-", dir=directory))
+        try:
+            write_binary(store, partial, csv_path)
+            os.rename(partial, output)
+        except OSError:
+            if not output.exists():
+                raise
+            # Another process renamed the same store into place first
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+
+    versions = re.compile(rf"{re.escape(stem)}-[0-9a-f]+\.store")
+    for outdated in directory.iterdir():
+        if outdated != output and versions.fullmatch(outdated.name):
+            shutil.rmtree(outdated, ignore_errors=True)
+    return output
+
+
+def share_stores(directory):
+    """
+    Convert the CSV stores loaded from now on into ``directory`` and map
+    them from there, so that processes forked afterwards share their pages
+    instead of holding a copy each. ``None`` turns sharing off.
+    """
+    global _shared_directory
+    _shared_directory = directory
+
+
+def load_store(csv_path=DEFAULT_DATA):
+    """
+    Return the PopulationStore for ``csv_path``, preferring its binary
+    store and falling back to the CSV when it is missing or stale.
+    Stores are loaded once per process and shared between app instances,
+    until the file they were read from changes.
+    """
+    store_path = binary_path(csv_path)
+    use_binary = store_path.exists() and not is_stale(store_path, csv_path)
+    if use_binary:
+        path = store_path.resolve()
+        stamp = ("binary", str(path), *source_stamp(path / "meta.json").values())
+    else:
+        path = Path(csv_path).resolve()
+        stamp = ("csv", str(path), *source_stamp(csv_path).values())
+
+    if stamp not in _loaded:
+        # Drop the previous version of the file, sessions still using it keep a reference
+        for outdated in [key for key in _loaded if key[1] == stamp[1]]:
+            del _loaded[outdated]
+        if use_binary:
+            _loaded[stamp] = open_binary(store_path)
+        else:
+            if store_path.exists():
+                logger.warning(
+                    "%s is stale, run 'us-population-convert %s' to refresh it",
+                    store_path,
+                    csv_path,
+                )
+            _loaded[stamp] = read_store(csv_path)
+            if _shared_directory is not None:
+                output = share_binary(_loaded[stamp], _shared_directory, csv_path)
+                _loaded[stamp] = open_binary(output)
+    return _loaded[stamp]
+
+
+# ---------------------------------------------------------
+# Command line
+# ---------------------------------------------------------
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Convert a US population CSV into a memory-mapped store",
+    )
+    parser.add_argument("csv", nargs="?", default=DEFAULT_DATA, help="Input CSV")
+    parser.add_argument(
+        "-o", "--output", help="Output directory (default: <csv>.store next to it)"
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=CHUNKSIZE,
+        help=f"CSV rows read at a time (default: {CHUNKSIZE})",
+    )
+    options = parser.parse_args(args)
+    output = convert(options.csv, options.output, options.chunksize)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from types import SimpleNamespace
+
+from .cache import RenderCache
+from .dataset import DEFAULT_DATA, load_store
+from .line import figure_size
+from .ranking import RankingEngine
+
+# Bumped whenever the layout of an export directory changes
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+
+# Sizes the size-dependent views are rendered at, resized by patching on serve
+HEATMAP_SIZE = {"width": 800, "height": 450}
+LINE_SIZE = {"width": 300, "height": 300, "dpi": 192, "pixelRatio": 2}
+
+# ---------------------------------------------------------
+# Export
+# ---------------------------------------------------------
+
+# Renderer of the worker process, created once by _init_worker()
+_renderer = None
+
+
+def _init_worker(data_path):
+    global _renderer
+    from .core import DashboardRenderer
+
+    _renderer = DashboardRenderer(load_store(data_path))
+
+
+def _write(directory, name, payload):
+    path = Path(directory, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = json.dumps(payload, separators=(",", ":"))
+    path.write_text(data)
+    return name, len(data)
+
+
+def _selection_payload(key):
+    from .core import RANKING_K_MAX
+
+    selection = _renderer.make_selection(key, None)
+    ranking = {}
+    for metric in _renderer.metrics:
+        ranking[metric] = list(_renderer.ranking.rank(key, metric, RANKING_K_MAX))
+    return {
+        "title": _renderer.panel_population_title(selection),
+        "donuts": list(_renderer.panel_donuts(selection)),
+        "gains_losses": list(_renderer.panel_gains_losses(selection)),
+        "ranking": ranking,
+    }
+
+
+# Each task writes a batch of files and returns their (name, size)
+def _export_task(directory, kind, *args):
+    if kind == "selection":
+        key, themes = args
+        written = [_write(directory, f"selections/{key}.json", _selection_payload(key))]
+        for theme in themes:
+            selection = SimpleNamespace(key=key, theme=theme)
+            payload = _renderer.panel_choropleth(selection)[2]
+            written.append(_write(directory, f"choropleth/{theme}/{key}.json", payload))
+        return written
+    if kind == "choropleth_skeleton":
+        payload = _renderer.choropleth_skeleton()
+        return [_write(directory, "choropleth/skeleton.json", payload)]
+    if kind == "heatmap":
+        (theme,) = args
+        payload = _renderer.heatmap(theme, HEATMAP_SIZE)
+        return [_write(directory, f"heatmap/{theme}.json", payload)]
+    if kind == "heatmap_data":
+        (theme,) = args
+        payload = _renderer.heatmap_template(theme, HEATMAP_SIZE)
+        return [
+            _write(directory, "heatmap/values.json", _renderer.heatmap_values()),
+            _write(directory, "heatmap/template.json", payload),
+        ]
+    if kind == "line":
+        payload = _renderer.line_view().render(**LINE_SIZE)
+        return [_write(directory, "line.json", payload)]
+    raise ValueError(f"Unknown export task {kind!r}")
+
+
+def export_dashboard(directory, data_path=DEFAULT_DATA, processes=None, themes=None):
+    """
+    Renders every panel payload of every selection/theme combination into
+    ``directory``, in parallel across ``processes`` worker processes.
+    ``themes`` defaults to every color theme of the dashboard.
+
+    The manifest is written last, so an interrupted export is never served.
+    Returns the manifest.
+    """
+    from .core import RANKING_K_MAX, color_theme_list
+
+    themes = list(color_theme_list if themes is None else themes)
+    store = load_store(data_path)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / MANIFEST).unlink(missing_ok=True)
+
+    tasks = [("heatmap_data", themes[0]), ("line",), ("choropleth_skeleton",)]
+    tasks += [("heatmap", theme) for theme in themes]
+    tasks += [("selection", key, themes) for key in store.components + store.years]
+
+    files = {}
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(str(data_path),)
+    ) as pool:
+        futures = [pool.submit(_export_task, str(directory), *task) for task in tasks]
+        for future in as_completed(futures):
+            files.update(future.result())
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "token": store.token,
+        "keys": store.components + store.years,
+        "themes": themes,
+        "metrics": RankingEngine(store).metrics,
+        "ranking_k": RANKING_K_MAX,
+        "years": store.years,
+        "population": [int(value) for value in store.totals(store.years)],
+        "heatmap_size": HEATMAP_SIZE,
+        "line_size": LINE_SIZE,
+        "files": dict(sorted(files.items())),
+    }
+    (directory / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def add_arguments(parser):
+    try:
+        parser.add_argument(
+            "--export",
+            metavar="DIR",
+            default=None,
+            help="Pre-render every panel payload into DIR and exit",
+        )
+        parser.add_argument(
+            "--export-processes",
+            type=int,
+            default=None,
+            help="Worker processes used by --export (default: one per CPU)",
+        )
+    except argparse.ArgumentError:
+        pass  # already registered
+
+
+def main(args):
+    """Runs ``--export`` when requested, returns False otherwise"""
+    if args.export is None:
+        return False
+    start = time.perf_counter()
+    data_path = getattr(args, "data", None) or DEFAULT_DATA
+    manifest = export_dashboard(args.export, data_path, args.export_processes)
+    size = sum(manifest["files"].values())
+    print(
+        f"Exported {len(manifest['files'])} payloads ({size / 1e6:.1f} MB)"
+        f" to {args.export} in {time.perf_counter() - start:.1f} s"
+        f" using {args.export_processes or os.cpu_count()} processes"
+    )
+    return True
+
+
+# ---------------------------------------------------------
+# Serve from export
+# ---------------------------------------------------------
+
+
+class ExportedLine:
+    """Line view answering resizes by scaling the exported figure"""
+
+    def __init__(self, payload, size):
+        self.payload = payload
+        self.size = figure_size(size["width"], size["height"], size["dpi"])
+
+    def render(self, width, height, dpi, pixelRatio):
+        inches = figure_size(width, height, dpi)
+        return dict(
+            self.payload,
+            width=self.payload["width"] * inches[0] / self.size[0],
+            height=self.payload["height"] * inches[1] / self.size[1],
+        )
+
+
+class ExportedDashboard:
+    """
+    Stands in for the live DashboardRenderer with the payloads written by
+    export_dashboard(). Panels only read (and keep) exported files: the
+    ranking tables are sliced to ``k`` and the heatmap/line are resized by
+    patching their sizes.
+    """
+
+    store = None
+    ranking = None
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        manifest_path = self.directory / MANIFEST
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"{manifest_path} not found, run --export first")
+        self.manifest = json.loads(manifest_path.read_text())
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported export format in {self.directory}")
+        self.keys = self.manifest["keys"]
+        self.metrics = self.manifest["metrics"]
+        self.years = self.manifest["years"]
+        self.population = self.manifest["population"]
+        self.cache = RenderCache(maxsize=len(self.manifest["files"]))
+        self.panels = {
+            "title": self.panel_population_title,
+            "donuts": self.panel_donuts,
+            "choropleth": self.panel_choropleth,
+            "gains_losses": self.panel_gains_losses,
+            "top_bottom_5": self.panel_top_bottom_5,
+        }
+
+    def load(self, name):
+        return self.cache.get_or_render(
+            name, lambda: json.loads((self.directory / name).read_text())
+        )
+
+    def make_selection(self, key, theme, metric="population", k=5):
+        return SimpleNamespace(
+            key=key,
+            theme=theme,
+            metric=metric,
+            k=k,
+            exported=self.load(f"selections/{key}.json"),
+        )
+
+    def panel_population_title(self, selection):
+        return selection.exported["title"]
+
+    def panel_top_bottom_5(self, selection):
+        top, bottom, metric = selection.exported["ranking"][selection.metric]
+        return top[: selection.k], bottom[: selection.k], metric, selection.k
+
+    def panel_gains_losses(self, selection):
+        return tuple(selection.exported["gains_losses"])
+
+    def panel_donuts(self, selection):
+        return tuple(selection.exported["donuts"])
+
+    def panel_choropleth(self, selection):
+        payload = self.load(f"choropleth/{selection.theme}/{selection.key}.json")
+        return selection.key, selection.theme, payload
+
+    def choropleth_skeleton(self):
+        return self.load("choropleth/skeleton.json")
+
+    def heatmap(self, theme, size):
+        from .core import heatmap_signals
+
+        signals = heatmap_signals(theme, **size)
+        spec = self.load(f"heatmap/{theme}.json")
+        return dict(spec, width=signals["width"], height=signals["height"])
+
+    def heatmap_template(self, theme, size):
+        return self.load("heatmap/template.json")
+
+    def heatmap_values(self):
+        return self.load("heatmap/values.json")
+
+    def line_view(self):
+        return ExportedLine(self.load("line.json"), self.manifest["line_size"])
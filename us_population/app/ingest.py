@@ -0,0 +1,159 @@
+import numpy as np
+import pandas
+
+from .store import PopulationStore
+
+# Rows parsed per chunk, peak memory is one chunk plus the aggregates
+CHUNKSIZE = 500_000
+
+# ---------------------------------------------------------
+# Streaming ingestion
+# ---------------------------------------------------------
+
+
+class _Axis:
+    """Labels numbered in order of first appearance"""
+
+    def __init__(self):
+        self.codes = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def labels(self):
+        return list(self.codes)
+
+    def encode(self, column):
+        """Codes of ``column`` and the positions of labels seen for the first time"""
+        codes, uniques = pandas.factorize(column)
+        known = len(self.codes)
+        lookup = np.array(
+            [self.codes.setdefault(label, len(self.codes)) for label in uniques],
+            dtype=np.int64,
+        )
+        new = np.flatnonzero(lookup >= known)
+        if len(new):
+            _, first = np.unique(codes, return_index=True)
+            new = first[new]
+        return lookup[codes], new
+
+
+class PopulationAggregator:
+    """
+    Sums a long-format population table into a states × keys matrix, one
+    chunk at a time. Rows sharing a (state, year/component) pair, e.g. the
+    counties of a state, are added up, so memory only grows with the number
+    of states and keys, never with the number of input rows.
+
+    Keys and states keep the order in which they first appear.
+    """
+
+    def __init__(self):
+        self.states = _Axis()
+        self.keys = _Axis()
+        self.state_codes = []
+        self.state_ids = []
+        self.sums = np.zeros((0, 0), dtype=np.int64)
+        self.present = np.zeros((0, 0), dtype=bool)
+        self.rows = 0
+
+    def _grow(self):
+        shape = (len(self.states), len(self.keys))
+        if shape == self.sums.shape:
+            return
+        # Over-allocate so a stream of new labels does not copy every chunk
+        capacity = tuple(
+            max(size, 2 * current) if size > current else current
+            for size, current in zip(shape, self.sums.shape)
+        )
+        if capacity != self.sums.shape:
+            sums = np.zeros(capacity, dtype=np.int64)
+            present = np.zeros(capacity, dtype=bool)
+            rows, cols = self.sums.shape
+            sums[:rows, :cols] = self.sums
+            present[:rows, :cols] = self.present
+            self.sums, self.present = sums, present
+
+    def add(self, chunk):
+        chunk = chunk.dropna(subset=["states", "year", "population"])
+        state_codes, new_states = self.states.encode(chunk["states"].to_numpy())
+        key_codes, _ = self.keys.encode(chunk["year"].astype(str).to_numpy())
+        self.state_codes += list(chunk["states_code"].to_numpy()[new_states])
+        self.state_ids += list(chunk["id"].to_numpy()[new_states])
+        self._grow()
+
+        # Reduce the chunk to one sum per (state, key) before scattering it
+        flat = state_codes * len(self.keys) + key_codes
+        cells, inverse = np.unique(flat, return_inverse=True)
+        sums = np.zeros(len(cells), dtype=np.int64)
+        np.add.at(sums, inverse, chunk["population"].to_numpy(dtype=np.int64))
+        rows, cols = np.divmod(cells, len(self.keys))
+        self.sums[rows, cols] += sums
+        self.present[rows, cols] = True
+        self.rows += len(chunk)
+
+    # -----------------------------------------------------
+    # Aggregates
+    # -----------------------------------------------------
+
+    @property
+    def shape(self):
+        return len(self.states), len(self.keys)
+
+    def matrix(self):
+        rows, cols = self.shape
+        return self.sums[:rows, :cols], self.present[:rows, :cols]
+
+    def totals(self):
+        """Population total of every key"""
+        return dict(zip(self.keys.labels, self.matrix()[0].sum(axis=0).tolist()))
+
+    def series(self, state):
+        """Population of ``state`` for every key it appears in"""
+        sums, present = self.matrix()
+        row = self.states.codes[state]
+        return {
+            key: int(sums[row, col])
+            for key, col in self.keys.codes.items()
+            if present[row, col]
+        }
+
+    def to_store(self):
+        """PopulationStore with one row per present (key, state) pair"""
+        sums, present = self.matrix()
+        # Key-major order gives every key a contiguous block of states
+        state_index, key_index = np.nonzero(present.T)[::-1]
+        state_codes = pandas.Categorical(self.state_codes)
+        return PopulationStore.from_columns(
+            {
+                "states": state_index,
+                "states_code": state_codes.codes[state_index],
+                "id": np.asarray(self.state_ids, dtype=np.int32)[state_index],
+                "year": key_index,
+                "population": sums[state_index, key_index],
+            },
+            {
+                "states": self.states.labels,
+                "states_code": list(state_codes.categories),
+                "year": self.keys.labels,
+            },
+        )
+
+
+def read_chunks(csv_path, chunksize=CHUNKSIZE):
+    """Only the store columns of ``csv_path``, ``chunksize`` rows at a time"""
+    return pandas.read_csv(
+        csv_path,
+        usecols=lambda name: name in PopulationStore.columns,
+        dtype={"states": str, "states_code": str, "year": str},
+        chunksize=chunksize,
+    )
+
+
+def ingest_csv(csv_path, chunksize=CHUNKSIZE):
+    """Stream ``csv_path`` into a PopulationAggregator"""
+    aggregator = PopulationAggregator()
+    for chunk in read_chunks(csv_path, chunksize):
+        aggregator.add(chunk)
+    return aggregator
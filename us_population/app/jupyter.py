@@ -0,0 +1,94 @@
+import asyncio
+import itertools
+from pathlib import Path
+
+from .dataset import DEFAULT_DATA, load_store
+
+SERVER_NAME = "us_population_jupyter"
+
+# ---------------------------------------------------------
+# Jupyter integration
+#
+# Every dashboard displayed in a kernel is a session of one trame server: a
+# child server with its own state (prefixed keys) and its own UI template,
+# reached on the port of the kernel's server. Sessions of the same data file
+# share its loaded store and DashboardRenderer, and the render cache is
+# process-wide, so a new display builds its UI and reads payloads already
+# rendered for the other sessions.
+#
+#     from us_population.app import jupyter
+#     await jupyter.show()
+#
+# jupyter_proxy_info() is the jupyter-server-proxy entry point, which runs
+# the dashboard as its own process from the JupyterLab launcher.
+# ---------------------------------------------------------
+
+_sessions = itertools.count(1)
+
+# Renderers shared by the sessions of this kernel, keyed by resolved data path
+_renderers = {}
+
+
+def server():
+    """Trame server of this kernel, every session is attached to it"""
+    from trame.app import get_server
+
+    return get_server(SERVER_NAME, client_type="vue3")
+
+
+def renderer(data_path=DEFAULT_DATA):
+    """DashboardRenderer shared by the sessions of ``data_path``"""
+    key = str(Path(data_path).resolve())
+    if key not in _renderers:
+        from .core import DashboardRenderer
+
+        _renderers[key] = DashboardRenderer(load_store(data_path))
+    return _renderers[key]
+
+
+def session(data_path=DEFAULT_DATA, heatmap_mode="inline", render_delay=0.1, **kwargs):
+    """
+    New dashboard session attached to the kernel's server. Returns its
+    MyTrameApp, displayed with ``await app.ui.ready`` and then ``app.ui``.
+    Other keyword arguments are passed to MyTrameApp.
+    """
+    from .core import MyTrameApp
+
+    index = next(_sessions)
+    child = server().create_child_server(prefix=f"session{index}_")
+    app = MyTrameApp(
+        child,
+        data_path=data_path,
+        heatmap_mode=heatmap_mode,
+        render_delay=render_delay,
+        renderer=renderer(data_path),
+        template_name=f"session{index}",
+        **kwargs,
+    )
+    # Sessions attached to a running server miss its server_ready event
+    if app.watcher is not None and _loop_running():
+        app.start_watching()
+    return app
+
+
+def _loop_running():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+async def show(data_path=DEFAULT_DATA, width="100%", height=900, **kwargs):
+    """Display a new dashboard session in the output of the current cell"""
+    app = session(data_path, **kwargs)
+    await app.ui.display_cell(width=width, height=height)
+
+
+def jupyter_proxy_info():
+    """Configuration of the jupyter-server-proxy launcher entry"""
+    return {
+        "command": ["us-population", "--server", "--timeout", "0", "--port", "{port}"],
+        "timeout": 30,
+        "launcher_entry": {"title": "US Population"},
+    }
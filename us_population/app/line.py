@@ -0,0 +1,61 @@
+from threading import Lock
+
+import numpy as np
+
+from ..widgets.figures import MatplotlibFigure
+from .cache import RenderCache
+
+# Sizes are snapped to this many pixels so a drag-resize reuses renders
+SIZE_BUCKET = 10
+
+# ---------------------------------------------------------
+# Line view
+# ---------------------------------------------------------
+
+
+def figure_size(width, height, dpi):
+    return (width - 10) / dpi, (height - 5) / dpi
+
+
+def size_bucket(width, height, dpi, pixelRatio):
+    def snap(value):
+        return int(round(value / SIZE_BUCKET) * SIZE_BUCKET)
+
+    return snap(width), snap(height), dpi, pixelRatio
+
+
+class LineView:
+    """
+    Per-session population line chart drawn on one persistent matplotlib
+    Figure through the object-oriented API (no pyplot global state).
+
+    Resizes reuse the figure and serialized payloads are cached per
+    (size, dpi, pixelRatio) bucket until the line data changes.
+    """
+
+    def __init__(self, years, population, cache_size=32):
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(layout="compressed")
+        self.axes = self.figure.add_subplot()
+        (self.line,) = self.axes.plot([], [])
+        self.axes.set_xticks([])
+        self.cache = RenderCache(maxsize=cache_size)
+        self._lock = Lock()
+        self.set_data(years, population)
+
+    def set_data(self, years, population):
+        with self._lock:
+            self.line.set_data(np.asarray(years, int), np.asarray(population, int))
+            self.axes.relim()
+            self.axes.autoscale_view()
+            self.cache.invalidate()
+
+    def render(self, width, height, dpi, pixelRatio):
+        bucket = size_bucket(width, height, dpi, pixelRatio)
+        return self.cache.get_or_render(bucket, lambda: self._draw(*bucket))
+
+    def _draw(self, width, height, dpi, pixelRatio):
+        with self._lock:
+            self.figure.set_size_inches(*figure_size(width, height, dpi))
+            return MatplotlibFigure.to_data(self.figure)
@@ -1,8 +1,32 @@
-from .core import MyTrameApp
+import sys
+
+from .profiling import StartupProfiler
 
 def main(server=None, **kwargs):
-    app = MyTrameApp(server)
-    app.server.start(**kwargs)
+    # Import the app lazily so --profile-startup can account for it
+    profiler = StartupProfiler(enabled="--profile-startup" in sys.argv)
+    with profiler.phase("import app"):
+        from trame.app import get_server
+        from . import export, workers
+        from .core import MyTrameApp
+
+    server = get_server(server, client_type="vue3")
+    MyTrameApp.add_arguments(server.cli)
+    export.add_arguments(server.cli)
+    workers.add_arguments(server.cli)
+    args = server.cli.parse_known_args()[0]
+    # A batch export needs the data only, not a dashboard
+    if export.main(args):
+        return
+
+    count = args.workers
+    with workers.shared_data(count):
+        app = MyTrameApp(server, profiler=profiler, defer_render=True)
+        app.ctrl.on_server_ready.add(profiler.report)
+        if count > 1:
+            workers.serve(app, count, **kwargs)
+        else:
+            app.server.start(**kwargs)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,230 @@
+import functools
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+
+from .cache import RenderCache
+
+PREFIX = "us_population"
+
+# Histogram upper bounds
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES = tuple(256 * 4**power for power in range(10))
+
+# ---------------------------------------------------------
+# Histograms
+# ---------------------------------------------------------
+
+
+class Histogram:
+    """Prometheus style histogram: per-bucket counts, sum and count"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Estimate interpolated inside the bucket holding the ``q`` quantile"""
+        counts, _, count = self.snapshot()
+        if count == 0:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower  # above the last bound
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def _bound(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+# ---------------------------------------------------------
+# Registry
+# ---------------------------------------------------------
+
+
+class Metrics:
+    """
+    Histograms of callback and panel render times (wall and CPU) and of the
+    serialized size of pushed payloads.
+
+    Recording costs a couple of clock reads and a bisect per observation.
+    Payload sizes are measured once per payload object, so re-pushing a
+    cached figure does not serialize it again. When disabled every hook is
+    a no-op.
+    """
+
+    help = {
+        "callback_wall_seconds": "Wall time of state change handlers and view updates",
+        "callback_cpu_seconds": "CPU time of state change handlers and view updates",
+        "render_wall_seconds": "Wall time spent rendering a panel",
+        "render_cpu_seconds": "CPU time spent rendering a panel",
+        "payload_bytes": "Serialized size of the payloads pushed to a view",
+    }
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self._sizes = RenderCache(maxsize=128)
+        self._lock = Lock()
+
+    def histogram(self, name, buckets, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    @contextmanager
+    def _timed(self, kind, **labels):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.histogram(f"{kind}_wall_seconds", SECONDS, **labels).observe(
+                time.perf_counter() - wall
+            )
+            self.histogram(f"{kind}_cpu_seconds", SECONDS, **labels).observe(
+                time.thread_time() - cpu
+            )
+
+    def callback(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self._timed("callback", callback=name)
+
+    def render(self, panel):
+        if not self.enabled:
+            return nullcontext()
+        return self._timed("render", panel=panel)
+
+    def timed_panel(self, panel, build):
+        """Wrap a panel builder so that its renders are recorded"""
+        if not self.enabled:
+            return build
+
+        @functools.wraps(build)
+        def timed(*args, **kwargs):
+            with self._timed("render", panel=panel):
+                return build(*args, **kwargs)
+
+        return timed
+
+    def payload(self, view, payload):
+        if not self.enabled or payload is None:
+            return
+        if isinstance(payload, str):
+            size = len(payload.encode())
+        else:
+            # Keyed on identity, the cache entry keeps the payload alive
+            cached = self._sizes.get(id(payload))
+            if cached is not None and cached[0] is payload:
+                size = cached[1]
+            else:
+                size = len(json.dumps(payload, separators=(",", ":"), default=str))
+                self._sizes.put(id(payload), (payload, size))
+        self.histogram("payload_bytes", BYTES, view=view).observe(size)
+
+    # -----------------------------------------------------
+    # Reporting
+    # -----------------------------------------------------
+
+    def exposition(self):
+        """Every histogram in the Prometheus text exposition format"""
+        lines = []
+        by_name = {}
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            by_name.setdefault(name, []).append((dict(labels), histogram))
+        for name, series in by_name.items():
+            metric = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in series:
+                counts, total, count = histogram.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(
+                    histogram.buckets + (float("inf"),), counts
+                ):
+                    cumulative += bucket_count
+                    lines.append(
+                        f"{metric}_bucket{_labels(labels, le=_bound(bound))} {cumulative}"
+                    )
+                lines.append(f"{metric}_sum{_labels(labels)} {total}")
+                lines.append(f"{metric}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One row per histogram for the diagnostics drawer"""
+        rows = []
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            _, total, count = histogram.snapshot()
+            scale, unit = (1, "B") if name.endswith("bytes") else (1000, "ms")
+            rows.append(
+                {
+                    "metric": name,
+                    "target": ",".join(str(value) for _, value in labels),
+                    "count": count,
+                    "mean": f"{scale * total / max(count, 1):.1f} {unit}",
+                    "p95": f"{scale * histogram.quantile(0.95):.1f} {unit}",
+                }
+            )
+        return rows
+
+    def add_route(self, wslink_server, path="/metrics"):
+        """Serve exposition() on ``path`` of the trame web server"""
+        from aiohttp import web
+
+        async def handler(request):
+            return web.Response(
+                body=self.exposition().encode(),
+                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+            )
+
+        wslink_server.app.router.add_get(path, handler)
+
+
+def instrumented(method):
+    """Record wall and CPU time of an app method as a callback"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.callback(method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+# Metrics used when instrumentation is disabled
+disabled = Metrics(enabled=False)
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from .scheduler import executor
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# Panel pipeline
+# ---------------------------------------------------------
+
+
+class PanelPipeline:
+    """
+    Renders the dashboard panels for one selection off the event loop.
+
+    ``prepare()`` computes the data shared by every panel once, then each
+    panel builder runs concurrently in the executor and is applied as soon
+    as it completes. Starting a new run cancels the previous one and any
+    result belonging to a superseded run is discarded. Without a running
+    event loop everything runs synchronously, in panel order.
+    """
+
+    def __init__(self, executor=executor):
+        self.executor = executor
+        self.generation = 0
+        self._task = None
+
+    def run(self, prepare, panels, apply, prepared=None):
+        self.generation += 1
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            shared = prepare()
+            if prepared is not None:
+                prepared(shared)
+            for name, build in panels.items():
+                apply(name, build(shared))
+            return None
+
+        self._task = loop.create_task(
+            self._run(self.generation, prepare, panels, apply, prepared)
+        )
+        return self._task
+
+    async def _run(self, generation, prepare, panels, apply, prepared):
+        loop = asyncio.get_running_loop()
+        pending = set()
+        try:
+            shared = await loop.run_in_executor(self.executor, prepare)
+            if generation != self.generation:
+                return
+            if prepared is not None:
+                prepared(shared)
+
+            names = {}
+            for name, build in panels.items():
+                future = loop.run_in_executor(self.executor, build, shared)
+                names[future] = name
+                pending.add(future)
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                if generation != self.generation:
+                    return
+                for future in done:
+                    apply(names[future], future.result())
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("Panel rendering failed")
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,91 @@
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+# ---------------------------------------------------------
+# Startup profiling
+# ---------------------------------------------------------
+
+
+def _packages(module_names):
+    counts = {}
+    for name in module_names:
+        package = name.split(".")[0]
+        counts[package] = counts.get(package, 0) + 1
+    return counts
+
+
+class StartupProfiler:
+    """
+    Records wall time, CPU time and newly imported modules for the named
+    phases of the app startup (``--profile-startup``).
+
+    Phases recorded after ``report()`` was printed are printed as they
+    complete, which covers views that only render once a client connects.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = []
+        self.reported = False
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    @contextmanager
+    def _record(self, name):
+        modules = set(sys.modules)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            phase = {
+                "name": name,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.process_time() - cpu,
+                "imports": _packages(set(sys.modules) - modules),
+            }
+            self.phases.append(phase)
+            if self.reported:
+                print(self._format_phase(phase))
+
+    def phase(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self._record(name)
+
+    def first(self, name):
+        """Like phase() but only records the first occurrence of ``name``"""
+        if not self.enabled or any(phase["name"] == name for phase in self.phases):
+            return nullcontext()
+        return self._record(name)
+
+    @staticmethod
+    def _format_phase(phase):
+        imports = sorted(phase["imports"].items(), key=lambda item: -item[1])
+        imports = ", ".join(f"{name}({count})" for name, count in imports[:4])
+        return (
+            f"  {phase['name']:<28} {phase['wall'] * 1000:>9.1f} ms"
+            f" {phase['cpu'] * 1000:>9.1f} ms  {imports}"
+        )
+
+    def report(self, **_):
+        if not self.enabled:
+            return
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        lines = [
+            "Startup profile",
+            f"  {'phase':<28} {'wall':>12} {'cpu':>12}  new modules (top packages)",
+        ]
+        lines += [self._format_phase(phase) for phase in self.phases]
+        lines.append(
+            f"  {'total':<28} {wall * 1000:>9.1f} ms {cpu * 1000:>9.1f} ms"
+            f"  {len(sys.modules)} modules loaded"
+        )
+        print("\n".join(lines))
+        self.reported = True
+
+
+# Profiler used when startup profiling is disabled
+disabled = StartupProfiler(enabled=False)
@@ -0,0 +1,131 @@
+import numpy as np
+
+# Metrics only defined for years whose previous year is in the data
+CHANGE_METRICS = ("difference", "growth")
+
+# ---------------------------------------------------------
+# Top-k ranking
+# ---------------------------------------------------------
+
+
+def top_k(values, k):
+    """Indices of the ``k`` largest values, largest first"""
+    values = np.asarray(values)
+    k = max(0, min(k, len(values)))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    # Negating keeps ties in original order, like a stable descending sort
+    order = -values.astype(np.float64)
+    if k < len(values):
+        candidates = np.argpartition(order, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.lexsort((candidates, order[candidates]))]
+
+
+def bottom_k(values, k):
+    """Indices of the ``k`` smallest values, smallest first"""
+    values = np.asarray(values)
+    k = max(0, min(k, len(values)))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    order = values.astype(np.float64)
+    if k < len(values):
+        candidates = np.argpartition(order, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.lexsort((-candidates, order[candidates]))]
+
+
+def percentages(values, scale):
+    """Values as a rounded percentage of ``scale``"""
+    if scale == 0:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.rint(100 * np.asarray(values, dtype=np.float64) / scale).astype(np.int64)
+
+
+def magnitude(values):
+    """Largest absolute value, used as 100% by the ranking tables"""
+    if len(values) == 0:
+        return 0
+    return float(max(np.max(values), abs(np.min(values))))
+
+
+def ranked_rows(names, values, indices, scale):
+    return [
+        {"state": str(name), "population": int(percent), "rank": rank}
+        for rank, (name, percent) in enumerate(
+            zip(names(indices), percentages(values[indices], scale))
+        )
+    ]
+
+
+class RankingEngine:
+    """
+    Ranks states for a selection by a configurable metric:
+
+    - ``population``: value of the selected year/component
+    - ``difference``: change over the previous year
+    - ``growth``: change over the previous year in percent
+    - any year/component key of the store, e.g. ``Births``
+
+    Components and the first year have no previous year, they are ranked by
+    population whatever the change metric asked for. ``rank`` returns the
+    metric it actually ranked by.
+
+    Rankings of a year or component are slices of the orders precomputed by
+    the MetricsCube, those of a year range (e.g. ``2012-2017``) partitions
+    of its span metrics.
+    """
+
+    def __init__(self, store, k=5, metric="population"):
+        self.store = store
+        self.k = k
+        self.metric = metric
+        self._cube = None
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            from .cube import MetricsCube
+
+            self._cube = MetricsCube(self.store)
+        return self._cube
+
+    @property
+    def metrics(self):
+        return ["population", "difference", "growth"] + self.store.components
+
+    def effective_metric(self, key, metric=None):
+        """Metric ``key`` is ranked by when ``metric`` is asked for"""
+        metric = metric or self.metric
+        span = self.cube.span(key)
+        if span is not None:
+            return metric
+        table, _ = self.cube.row(key, metric)
+        return table if metric in CHANGE_METRICS else metric
+
+    def rank(self, key, metric=None, k=None):
+        """(top rows, bottom rows, metric ranked by) of the ``key`` selection"""
+        k = self.k if k is None else k
+        metric = self.effective_metric(key, metric)
+        states = self.store.states
+
+        def names(indices):
+            return states[indices]
+
+        span = self.cube.span(key)
+        if span is not None and metric in span.values:
+            codes, values = span.ranked(metric)
+            scale = magnitude(values[codes])
+            top = ranked_rows(names, values, codes[top_k(values[codes], k)], scale)
+            bottom = ranked_rows(
+                names, values, codes[bottom_k(values[codes], k)], scale
+            )
+            return top, bottom, metric
+
+        order, values, scale = self.cube.ranked(key, metric)
+        k = max(0, min(k, len(order)))
+        top = ranked_rows(names, values, order[:k], scale)
+        bottom = ranked_rows(names, values, order[::-1][:k], scale)
+        return top, bottom, metric
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+from pathlib import Path
+
+import pandas
+
+from .cache import render_cache
+from .cube import parse_range, range_touches
+from .dataset import binary_path, load_store, source_stamp
+from .ranking import RankingEngine
+from .scheduler import executor
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks of the data file
+INTERVAL = 2.0
+
+# Watchers of this process, keyed by resolved data path
+_watchers = {}
+
+# ---------------------------------------------------------
+# Data changes
+# ---------------------------------------------------------
+
+
+def file_stamp(csv_path):
+    """Changes whenever the CSV or its converted store is rewritten"""
+    stamps = []
+    for path in (Path(csv_path), binary_path(csv_path) / "meta.json"):
+        try:
+            stamps.append(tuple(source_stamp(path).values()))
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def _cells(store):
+    frame = store.frame
+    index = pandas.MultiIndex.from_arrays(
+        [frame["year"].astype(str).to_numpy(), frame["states"].astype(str).to_numpy()],
+        names=["year", "states"],
+    )
+    return pandas.DataFrame(
+        {
+            "population": frame["population"].to_numpy(),
+            "states_code": frame["states_code"].astype(str).to_numpy(),
+        },
+        index=index,
+    )
+
+
+class DataChange:
+    """
+    Difference between two loads of the same dataset.
+
+    ``rows`` holds the (year, states) cells that were added, removed or
+    changed, with their ``old_*`` and ``new_*`` values (NaN when missing).
+    ``keys`` are the year/component keys of those cells, every key when the
+    key axis itself changed. ``selections`` are the keys whose panels must be
+    rendered again: the touched keys and the years following touched years,
+    since their difference changed too. ``ranking`` is the RankingEngine of
+    the new store, with its metrics cube.
+    """
+
+    def __init__(self, previous, store):
+        self.previous = previous
+        self.store = store
+        cells = _cells(previous).join(
+            _cells(store), how="outer", lsuffix="_old", rsuffix="_new"
+        )
+        population = cells["population_old"].ne(cells["population_new"])
+        codes = cells["states_code_old"].ne(cells["states_code_new"])
+        self.rows = cells[population | codes]
+
+        self.axes_changed = previous.keys != store.keys
+        if self.axes_changed:
+            self.keys = set(previous.keys) | set(store.keys)
+        else:
+            self.keys = set(self.rows.index.get_level_values("year"))
+        self.years = {key for key in self.keys if key.isdigit()}
+        following = {str(int(year) + 1) for year in self.years}
+        self.selections = (self.keys | following) & set(store.keys)
+        self._ranking = None
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    @property
+    def ranking(self):
+        if self._ranking is None:
+            self._ranking = RankingEngine(self.store)
+        return self._ranking
+
+    def touches(self, key):
+        """Whether the values of ``key``, a year, component or year range, changed"""
+        if parse_range(key) is not None:
+            return self.axes_changed or range_touches(key, self.years)
+        return key in self.keys
+
+    def affects(self, key):
+        """Whether the panels of the ``key`` selection must be rendered again"""
+        if parse_range(key) is not None:
+            return self.touches(key)
+        return key in self.selections
+
+    @property
+    def skeleton_changed(self):
+        """Whether the choropleth skeleton, drawn from the first key, changed"""
+        key = self.store.keys[0]
+        return key != self.previous.keys[0] or key in self.keys
+
+    def heatmap_changes(self):
+        """Heatmap rows to insert and remove, as (states, year) records"""
+        rows = self.rows[self.rows.index.get_level_values("year").isin(self.years)]
+        insert, remove = [], []
+        for (year, state), population in rows["population_new"].items():
+            remove.append({"states": state, "year": year})
+            if not pandas.isna(population):
+                insert.append(
+                    {"year": year, "states": state, "population": int(population)}
+                )
+        return insert, remove
+
+
+# Which payloads of the previous store are still valid for the new one, by cache key kind
+_CARRY_OVER = {
+    "choropleth_skeleton": lambda change, key: not change.skeleton_changed,
+    "choropleth_patch": lambda change, key: not (
+        change.skeleton_changed or change.touches(key[2])
+    ),
+    "heatmap": lambda change, key: not change.years,
+    "heatmap_values": lambda change, key: not change.years,
+}
+
+
+def carry_over(change, cache=render_cache):
+    """
+    Re-key the cached payloads the change did not affect to the new store
+    token and drop every other payload of the previous store.
+    """
+    old, new = change.previous.token, change.store.token
+
+    def outdated(key):
+        return isinstance(key, tuple) and len(key) > 1 and key[1] == old
+
+    kept = 0
+    for key, value in cache.items():
+        if outdated(key) and _CARRY_OVER.get(key[0], lambda *_: False)(change, key):
+            cache.put((key[0], new, *key[2:]), value)
+            kept += 1
+    cache.invalidate(outdated)
+    return kept
+
+
+# ---------------------------------------------------------
+# Watcher
+# ---------------------------------------------------------
+
+
+class DataWatcher:
+    """
+    Polls a data file and reloads it once it stopped changing for one
+    interval, so that half-written files are not picked up.
+
+    Loading, diffing, updating the render cache and building the metrics
+    cube of the new data happen once per change in the render executor;
+    subscribers then get the DataChange on the event loop. A file that fails to load is logged and the loaded data is
+    kept until the file changes again.
+    """
+
+    def __init__(self, path, store, interval=INTERVAL):
+        self.path = path
+        self.store = store
+        self.interval = interval
+        self.stamp = file_stamp(path)
+        self.subscribers = []
+        self._pending = None
+        self._task = None
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._watch())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def poll(self):
+        """Reload when the file changed and then stayed the same, returns the DataChange"""
+        stamp = file_stamp(self.path)
+        if stamp == self.stamp:
+            self._pending = None
+            return None
+        if stamp != self._pending:
+            self._pending = stamp  # still being written
+            return None
+        self._pending = None
+        self.stamp = stamp
+        return self.reload()
+
+    def reload(self):
+        try:
+            store = load_store(self.path)
+        except Exception:
+            logger.exception("Could not reload %s, keeping the loaded data", self.path)
+            return None
+        change = DataChange(self.store, store)
+        if change:
+            carry_over(change)
+            # Built here, off the event loop, for the apps applying the change
+            change.ranking.cube
+            logger.info(
+                "Reloaded %s: %d values changed in %s",
+                self.path,
+                len(change.rows),
+                ", ".join(sorted(change.keys)),
+            )
+        self.store = store
+        return change or None
+
+    def notify(self, change):
+        for callback in list(self.subscribers):
+            try:
+                callback(change)
+            except Exception:
+                logger.exception("Could not apply the reloaded data")
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                change = await loop.run_in_executor(executor, self.poll)
+            except Exception:
+                logger.exception("Could not check %s for changes", self.path)
+                continue
+            if change is not None:
+                self.notify(change)
+
+
+def watch(path, store, interval=INTERVAL):
+    """Shared watcher of ``path``, one per data file and process"""
+    key = str(Path(path).resolve())
+    if key not in _watchers:
+        _watchers[key] = DataWatcher(path, store, interval)
+    return _watchers[key]
@@ -0,0 +1,65 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Process-wide pool used for off-loop rendering
+executor = ThreadPoolExecutor(
+    max_workers=min(4, os.cpu_count() or 1),
+    thread_name_prefix="us-population-render",
+)
+
+# ---------------------------------------------------------
+# Render scheduler
+# ---------------------------------------------------------
+
+
+class RenderScheduler:
+    """
+    Coalesces bursts of render requests per channel (e.g. "heatmap").
+
+    A request waits ``delay`` seconds for a newer one on the same channel,
+    then renders in the executor. Any newer request cancels the pending or
+    in-flight one, so only the latest result is ever applied. Without a
+    running event loop (headless use) requests render synchronously.
+    """
+
+    def __init__(self, delay=0.1, executor=executor):
+        self.delay = delay
+        self.executor = executor
+        self._tasks = {}
+        self._generations = {}
+
+    def schedule(self, channel, render, apply, delay=None):
+        generation = self._generations.get(channel, 0) + 1
+        self._generations[channel] = generation
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            apply(render())
+            return None
+
+        task = self._tasks.pop(channel, None)
+        if task is not None:
+            task.cancel()
+        delay = self.delay if delay is None else delay
+        task = loop.create_task(self._run(channel, generation, render, apply, delay))
+        self._tasks[channel] = task
+        return task
+
+    def is_current(self, channel, generation):
+        return self._generations.get(channel) == generation
+
+    async def _run(self, channel, generation, render, apply, delay):
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, render)
+            if self.is_current(channel, generation):
+                apply(result)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self._tasks.get(channel) is asyncio.current_task():
+                del self._tasks[channel]
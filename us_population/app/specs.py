@@ -0,0 +1,198 @@
+import hashlib
+import json
+
+import numpy as np
+
+# ---------------------------------------------------------
+# Vega-Lite specs
+#
+# The donut and heatmap specs are emitted directly as dicts, without going
+# through Altair's object model and schema validation. They are the dicts
+# ``vega.Figure.to_data`` produces from the make_donut and make_heatmap
+# Altair charts of core.py, including the content-hashed names of inline
+# datasets, which tests/test_specs.py checks against the installed Altair.
+#
+# Validation against the Vega-Lite schema bundled with Altair is off by
+# default, set_validation(True) checks every spec built afterwards.
+# ---------------------------------------------------------
+
+# Schema of the Vega-Lite version Altair 6.3 targets, setup.cfg pins altair 6.3.x
+SCHEMA = "https://vega.github.io/schema/vega-lite/v6.4.1.json"
+
+_VIEW = {"continuousWidth": 300, "continuousHeight": 300}
+
+DONUT_COLORS = {
+    "above": ["#27AE60", "#12783D"],
+    "below": ["#E74C3C", "#781F16"],
+}
+
+_HEATMAP_AXIS = {
+    "title": "",
+    "titleFontSize": 18,
+    "titleFontWeight": 900,
+    "titlePadding": 15,
+}
+
+_validate = False
+_validator = None
+
+
+def set_validation(enabled):
+    """Validate every spec built from now on against the Vega-Lite schema"""
+    global _validate
+    _validate = bool(enabled)
+
+
+def validate(spec):
+    """Raise jsonschema.ValidationError unless ``spec`` is valid Vega-Lite"""
+    global _validator
+    if _validator is None:
+        import jsonschema
+        from altair.vegalite import load_schema
+
+        schema = load_schema()
+        _validator = jsonschema.validators.validator_for(schema)(schema)
+    _validator.validate(spec)
+    return spec
+
+
+def _emit(spec):
+    return validate(spec) if _validate else spec
+
+
+def dataset_name(values):
+    """Name Altair gives to the inline dataset ``values``"""
+    if values == [{}]:
+        return "empty"
+    values_json = json.dumps(values, sort_keys=True, default=str)
+    return "data-" + hashlib.sha256(values_json.encode()).hexdigest()[:32]
+
+
+def records(columns):
+    """Row records of ``columns``, a DataFrame or {name: values}, as JSON types"""
+    names = list(columns)
+    values = [np.asarray(columns[name]).tolist() for name in names]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+# ---------------------------------------------------------
+# Donut
+# ---------------------------------------------------------
+
+
+def donut(value, text, option):
+    """
+    Percentage ``value`` drawn as an arc over a full background ring,
+    with the ``value %`` label in its center.
+    """
+    colors = DONUT_COLORS["above" if option == "above" else "below"]
+    background = [{"Topic": "", "% value": 100}, {"Topic": text, "% value": 0}]
+    values = [{"Topic": "", "% value": 100 - value}, {"Topic": text, "% value": value}]
+    background_name, values_name = dataset_name(background), dataset_name(values)
+
+    def encoding(**extra):
+        return {
+            "color": {
+                "field": "Topic",
+                "legend": None,
+                "scale": {"domain": [text, ""], "range": list(colors)},
+                "type": "nominal",
+            },
+            **extra,
+            "theta": {"field": "% value", "type": "quantitative"},
+        }
+
+    def arc(corner_radius):
+        return {"type": "arc", "cornerRadius": corner_radius, "innerRadius": 45}
+
+    label = {
+        "type": "text",
+        "align": "center",
+        "color": colors[0],
+        "font": "Lato",
+        "fontSize": 32,
+        "fontStyle": "italic",
+        "fontWeight": 700,
+    }
+    return _emit(
+        {
+            "config": {"view": dict(_VIEW)},
+            "layer": [
+                {
+                    "data": {"name": background_name},
+                    "mark": arc(20),
+                    "encoding": encoding(),
+                },
+                {
+                    "data": {"name": values_name},
+                    "mark": arc(25),
+                    "encoding": encoding(),
+                },
+                {
+                    "data": {"name": values_name},
+                    "mark": label,
+                    "encoding": encoding(text={"value": f"{value} %"}),
+                },
+            ],
+            "height": 130,
+            "width": 130,
+            "$schema": SCHEMA,
+            "datasets": {background_name: background, values_name: values},
+        }
+    )
+
+
+# ---------------------------------------------------------
+# Heatmap
+# ---------------------------------------------------------
+
+
+def heatmap(data, theme, width, height, scheme_param=None):
+    """
+    Max ``population`` per (``year``, ``states``) cell.
+
+    ``data`` is either a mapping of columns, embedded as an inline dataset,
+    or ``{"name": ...}`` for a dataset the client provides. With
+    ``scheme_param`` the color scheme is read from a signal of that name,
+    initialized to ``theme``.
+    """
+    scheme = theme if scheme_param is None else {"expr": scheme_param}
+    spec = {
+        "config": {
+            "view": dict(_VIEW),
+            "axis": {"labelFontSize": 12, "titleFontSize": 12},
+        },
+        "data": None,
+        "mark": {"type": "rect"},
+        "encoding": {
+            "color": {
+                "aggregate": "max",
+                "field": "population",
+                "legend": None,
+                "scale": {"scheme": scheme},
+                "type": "quantitative",
+            },
+            "stroke": {"value": "black"},
+            "strokeWidth": {"value": 0.25},
+            "x": {"axis": dict(_HEATMAP_AXIS), "field": "states", "type": "ordinal"},
+            "y": {
+                "axis": {"labelAngle": 0, **_HEATMAP_AXIS},
+                "field": "year",
+                "type": "ordinal",
+            },
+        },
+        "height": int(height - 130),
+    }
+    if scheme_param is not None:
+        spec["params"] = [{"name": scheme_param, "value": theme}]
+    spec["width"] = int(width - 60)
+    spec["$schema"] = SCHEMA
+
+    if set(data) == {"name"}:
+        spec["data"] = dict(data)
+    else:
+        values = records(data)
+        name = dataset_name(values)
+        spec["data"] = {"name": name}
+        spec["datasets"] = {name: values}
+    return _emit(spec)
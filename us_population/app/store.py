@@ -0,0 +1,157 @@
+import hashlib
+
+import numpy as np
+import pandas
+
+# ---------------------------------------------------------
+# Columnar population store
+# ---------------------------------------------------------
+
+
+class PopulationStore:
+    """
+    Long-format population table loaded once and kept sorted by
+    year/component and then by state, so that every selection is a
+    contiguous row block.
+
+    States, state codes and year/component keys are categoricals and
+    populations are fixed-width integers. ``select(key)`` and
+    ``population(key)`` return views over the underlying columns.
+    """
+
+    columns = ["states", "states_code", "id", "year", "population"]
+
+    def __init__(self, frame):
+        # frame must already be in canonical layout, see from_frame()
+        self.frame = frame
+        self._build_index()
+
+    @classmethod
+    def from_frame(cls, frame):
+        keys = pandas.Categorical(frame["year"].astype(str))
+        keys = keys.reorder_categories(
+            pandas.unique(frame["year"].astype(str)), ordered=True
+        )
+        states = pandas.Categorical(
+            frame["states"], categories=pandas.unique(frame["states"])
+        )
+
+        # Stable sort on (key, state) keeps the file order inside each block
+        order = np.lexsort((states.codes, keys.codes))
+        return cls(
+            pandas.DataFrame(
+                {
+                    "states": states.take(order),
+                    "states_code": pandas.Categorical(
+                        frame["states_code"].to_numpy()[order]
+                    ),
+                    "id": frame["id"].to_numpy(dtype=np.int32)[order],
+                    "year": keys.take(order),
+                    "population": frame["population"].to_numpy(dtype=np.int64)[order],
+                },
+                index=frame.index[order],
+            )
+        )
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls.from_frame(pandas.read_csv(path, index_col=0, dtype={"year": str}))
+
+    @classmethod
+    def from_columns(cls, columns, categories, index=None):
+        """
+        Wrap already sorted column arrays without copying them.
+        Categorical columns are given as integer codes plus their categories.
+        """
+        data = {}
+        for name in cls.columns:
+            if name in categories:
+                data[name] = pandas.Categorical.from_codes(
+                    columns[name],
+                    dtype=pandas.CategoricalDtype(
+                        categories[name], ordered=(name == "year")
+                    ),
+                )
+            else:
+                data[name] = columns[name]
+        return cls(pandas.DataFrame(data, index=index, copy=False))
+
+    def _build_index(self):
+        key_codes = self.frame["year"].cat.codes.to_numpy()
+        counts = np.bincount(key_codes, minlength=len(self.keys))
+        stops = np.cumsum(counts)
+        starts = stops - counts
+        self._starts = starts
+        self._slices = {
+            key: slice(int(start), int(stop))
+            for key, start, stop in zip(self.keys, starts, stops)
+        }
+        self._population = self.frame["population"].to_numpy()
+        self._state_codes = self.frame["states"].cat.codes.to_numpy()
+        self._token = None
+
+    # -----------------------------------------------------
+    # Axes
+    # -----------------------------------------------------
+
+    @property
+    def keys(self):
+        return list(self.frame["year"].cat.categories)
+
+    @property
+    def years(self):
+        return [key for key in self.keys if key.isdigit()]
+
+    @property
+    def components(self):
+        return [key for key in self.keys if not key.isdigit()]
+
+    @property
+    def states(self):
+        return self.frame["states"].cat.categories
+
+    @property
+    def token(self):
+        """Content digest used to key process-wide caches"""
+        if self._token is None:
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update("|".join(self.keys).encode())
+            digest.update("|".join(self.states).encode())
+            digest.update(np.ascontiguousarray(self._state_codes).tobytes())
+            digest.update(np.ascontiguousarray(self._population).tobytes())
+            self._token = digest.hexdigest()
+        return self._token
+
+    def __contains__(self, key):
+        return key in self._slices
+
+    def __len__(self):
+        return len(self.frame)
+
+    # -----------------------------------------------------
+    # Lookups
+    # -----------------------------------------------------
+
+    def select(self, *keys):
+        slices = [self._slices[key] for key in keys]
+        if all(a.stop == b.start for a, b in zip(slices, slices[1:])):
+            return self.frame.iloc[slices[0].start : slices[-1].stop]
+        return pandas.concat([self.frame.iloc[s] for s in slices])
+
+    def population(self, key):
+        return self._population[self._slices[key]]
+
+    def state_codes(self, key):
+        return self._state_codes[self._slices[key]]
+
+    def aligned(self, key, fill_value=0):
+        """Population of ``key`` indexed by state code"""
+        values = np.full(len(self.states), fill_value, dtype=np.int64)
+        values[self.state_codes(key)] = self.population(key)
+        return values
+
+    def totals(self, keys=None):
+        keys = self.keys if keys is None else keys
+        sums = np.add.reduceat(self._population, self._starts) if len(self) else []
+        by_key = dict(zip(self.keys, sums))
+        return [int(by_key[key]) for key in keys]
@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+from contextlib import contextmanager
+
+# Longest a buffered change waits for the rest of its user action, in seconds
+MAX_LATENCY = 0.2
+
+# ---------------------------------------------------------
+# State transactions
+#
+# trame pushes the pending state changes to the client every time the state
+# is flushed, and the panels of a selection are applied as they complete, so
+# one user action used to reach the client as several messages, each applied
+# and laid out on its own.
+#
+# Each user action opens its own transaction, which buffers the view and
+# state changes applied for it and is held open by the renders it started.
+# Once they are done it sets them all at once and flushes, so the client gets
+# one message holding the last value of each changed key. trame drops the
+# values equal to those the client already has.
+#
+# The transaction of an action is found through a context variable: asyncio
+# tasks copy the context they are created in, so the panels rendered by the
+# pipeline or the scheduler for an action are applied in its transaction.
+# Actions overlapping in time are committed independently, and no change
+# waits more than ``max_latency`` seconds behind a slower render.
+# ---------------------------------------------------------
+
+
+class StateTransaction:
+    """
+    State changes of one user action, committed once nothing holds it.
+
+    ``with transaction:`` holds it around a block and ``track(task)`` until
+    an asyncio task is done. Changes buffered for ``max_latency`` seconds
+    are committed early, the transaction then buffers the next ones.
+    """
+
+    def __init__(self, state, max_latency=MAX_LATENCY):
+        self.state = state
+        self.max_latency = max_latency
+        self.depth = 0
+        self.changes = {}
+        self.commits = 0
+        self._timer = None
+
+    def __enter__(self):
+        self.hold()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @property
+    def open(self):
+        return self.depth > 0
+
+    def __setitem__(self, key, value):
+        if not self.open:
+            self.state[key] = value
+            return
+        self.changes[key] = value
+        if self._timer is None and self.max_latency is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return  # synchronous use, committed on release
+            self._timer = loop.call_later(self.max_latency, self.commit)
+
+    def update(self, changes=(), **kwargs):
+        for key, value in dict(changes, **kwargs).items():
+            self[key] = value
+
+    def hold(self):
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            self.commit()
+
+    def track(self, task):
+        """Keep the transaction open until ``task`` is done, ``None`` is ignored"""
+        if task is not None and not task.done():
+            self.hold()
+            task.add_done_callback(lambda _: self.release())
+        return task
+
+    def commit(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.changes:
+            return
+        changes, self.changes = self.changes, {}
+        self.commits += 1
+        # Within a flush of the state, e.g. from a change listener, the changes
+        # go out with the rest of that flush
+        self.state.update(changes)
+        self.state.flush()
+
+
+class Transactions:
+    """
+    Transactions of the user actions changing one state.
+
+    ``join()`` enters the transaction of the current action, or opens one
+    for the block when there is none. ``action()`` always opens a new one,
+    e.g. for renders that must not hold the action they are started from.
+    Changes and tracked tasks go to the current transaction, changes made
+    outside of any go to the state directly.
+    """
+
+    def __init__(self, state, max_latency=MAX_LATENCY):
+        self.state = state
+        self.max_latency = max_latency
+        self._current = contextvars.ContextVar("transaction", default=None)
+
+    @property
+    def current(self):
+        """Open transaction of the current action, None outside of any"""
+        transaction = self._current.get()
+        return transaction if transaction is not None and transaction.open else None
+
+    @contextmanager
+    def action(self):
+        transaction = StateTransaction(self.state, self.max_latency)
+        token = self._current.set(transaction)
+        try:
+            with transaction:
+                yield transaction
+        finally:
+            self._current.reset(token)
+
+    @contextmanager
+    def join(self):
+        transaction = self.current
+        if transaction is None:
+            with self.action() as transaction:
+                yield transaction
+        else:
+            with transaction:
+                yield transaction
+
+    def __setitem__(self, key, value):
+        (self.current or self.state)[key] = value
+
+    def update(self, changes=(), **kwargs):
+        (self.current or self.state).update(dict(changes), **kwargs)
+
+    def track(self, task):
+        transaction = self.current
+        return task if transaction is None else transaction.track(task)
@@ -0,0 +1,167 @@
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+
+from . import dataset
+
+logger = logging.getLogger(__name__)
+
+# A worker exiting sooner than this after its start is not restarted
+MIN_UPTIME = 5.0
+
+# ---------------------------------------------------------
+# Multi-worker serving
+#
+# The parent process loads the dataset and builds the app once, then forks
+# the workers. They share those pages copy-on-write, and the population
+# columns themselves are memory-mapped from one binary store: the converted
+# store next to the CSV when it is fresh, or one converted into shared memory
+# at startup. Every worker binds the same port with SO_REUSEPORT and the
+# kernel spreads incoming connections across them. A websocket session stays
+# on the worker it connected to.
+# ---------------------------------------------------------
+
+
+def add_arguments(parser):
+    try:
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Serve from this many forked processes sharing one port and one "
+            "copy of the data (Linux, default: 1)",
+        )
+    except argparse.ArgumentError:
+        pass  # already registered
+
+
+@contextmanager
+def shared_data(workers):
+    """Share the stores loaded inside this block with the workers forked from it"""
+    if workers <= 1:
+        yield
+        return
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(prefix="us-population-", dir=directory) as path:
+        dataset.share_stores(path)
+        try:
+            yield
+        finally:
+            dataset.share_stores(None)
+
+
+def reuse_port():
+    """Make the aiohttp sites of this process bind with SO_REUSEPORT"""
+    from aiohttp import web
+
+    class ReusePortSite(web.TCPSite):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("reuse_port", True)
+            super().__init__(*args, **kwargs)
+
+    web.TCPSite = ReusePortSite
+
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def _worker(server, index, port, kwargs):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent stops the workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    reuse_port()
+    # Stores reloaded with --watch are still shared: the first worker to load a
+    # version writes it, the others map it (see dataset.share_binary)
+    # Workers live as long as the parent, not until their last client leaves
+    kwargs = {**kwargs, "port": port, "timeout": 0}
+    if index > 0:
+        kwargs.update(open_browser=False, show_connection_info=False)
+    server.start(**kwargs)
+
+
+def serve(app, workers, **kwargs):
+    """
+    Run ``workers`` processes serving ``app`` on one port until interrupted.
+    Workers that crash are restarted, unless they crash right after starting.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("--workers needs SO_REUSEPORT (Linux, macOS or BSD)")
+    options = app.server.cli.parse_known_args()[0]
+    host = kwargs.get("host") or options.host
+    port = kwargs.get("port", options.port)
+    if not port:
+        port = free_port(host)
+
+    # Work shared by every worker is done once, before forking: rendering the
+    # first selection imports the charting libraries and fills the render cache
+    if app.store is not None:
+        app.store.token  # content digest keying the render cache
+    app.render_selection()
+    app.update_line_size(None)
+    gc.collect()
+    gc.freeze()  # collections would otherwise touch, and copy, every shared object
+
+    context = multiprocessing.get_context("fork")
+    processes = {}
+
+    def spawn(index):
+        process = context.Process(
+            target=_worker,
+            args=(app.server, index, port, kwargs),
+            name=f"us-population-worker-{index}",
+        )
+        process.start()
+        processes[index] = (process, time.monotonic())
+
+    stopping = False
+
+    def stop(*args):
+        nonlocal stopping
+        stopping = True
+
+    previous = {
+        signum: signal.signal(signum, stop)
+        for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+        for index in range(workers):
+            spawn(index)
+        logger.info("Serving on %s:%d with %d workers", host, port, workers)
+        while not stopping and processes:
+            time.sleep(0.5)
+            for index, (process, started) in list(processes.items()):
+                if process.is_alive():
+                    continue
+                del processes[index]
+                if stopping or process.exitcode == 0:
+                    continue
+                if time.monotonic() - started < MIN_UPTIME:
+                    logger.error(
+                        "Worker %d exited with status %s right after starting",
+                        index,
+                        process.exitcode,
+                    )
+                    stopping = True
+                    continue
+                logger.warning(
+                    "Worker %d exited with status %s, restarting it",
+                    index,
+                    process.exitcode,
+                )
+                spawn(index)
+    finally:
+        for process, _ in processes.values():
+            process.terminate()
+        for process, _ in processes.values():
+            process.join(10)
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
@@ -0,0 +1,43 @@
+from trame_client.encoders.numpy import encode
+from trame_client.widgets.core import AbstractElement
+from trame_matplotlib import module as matplotlib_module
+
+__all__ = [
+    "MatplotlibFigure",
+]
+
+
+# Same client component as trame.widgets.matplotlib.Figure, but matplotlib
+# and mpld3 are only imported once a figure is actually serialized.
+class MatplotlibFigure(AbstractElement):
+    _next_id = 0
+
+    def __init__(self, figure=None, **kwargs):
+        MatplotlibFigure._next_id += 1
+        self._key = f"us_population__matplotlib_{MatplotlibFigure._next_id}"
+
+        super().__init__("vue-matplotlib", **kwargs)
+        if self.server:
+            self.server.enable_module(matplotlib_module)
+
+        self._attributes["name"] = f'name="{self._key}"'
+        self._attributes["spec"] = f':spec="{self._key}"'
+        self._figure = figure
+        self.update()
+
+    def update(self, figure=None, **kwargs):
+        if figure:
+            self._figure = figure
+
+        if self._figure:
+            self.server.state[self._key] = self.to_data(self._figure)
+
+    @property
+    def key(self):
+        return self._key
+
+    @staticmethod
+    def to_data(figure, **kwargs):
+        import mpld3
+
+        return encode(mpld3.fig_to_dict(figure))
@@ -1,4 +1,6 @@
 from trame_client.widgets.core import AbstractElement
+from trame_vega import module as vega_module
+
 from .. import module
 
 
@@ -10,6 +12,7 @@ class HtmlElement(AbstractElement):
             
 __all__ = [
     "CustomWidget",
+    "VegaDataView",
 ]
 
 # Expose your vue component(s)
@@ -27,3 +30,23 @@ class CustomWidget(HtmlElement):
             "click",
             "change",
         ]
+
+
+# Vega-Lite view fed through a named dataset, patched with signals/changesets.
+# It embeds the spec through trame-vega's VueVega component.
+class VegaDataView(HtmlElement):
+    def __init__(self, **kwargs):
+        super().__init__(
+            "us-population-vega-data-view",
+            **kwargs,
+        )
+        if self.server:
+            self.server.enable_module(vega_module)
+        self._attr_names += [
+            "spec",
+            "dataset",
+            "values",
+            "changes",
+            "signals",
+            ("key_fields", "keyFields"),
+        ]
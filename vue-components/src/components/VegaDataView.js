@@ -0,0 +1,131 @@
+import { h, resolveComponent } from "vue";
+
+// Vega-Lite view whose data lives in a named dataset. The spec and the
+// initial values are sent once; afterwards only signal values and
+// insert/remove changesets are pushed from the server. The spec is embedded
+// by trame-vega's VueVega component, which keeps the embed result on `viz`.
+export default {
+  props: {
+    spec: {
+      type: Object,
+    },
+    dataset: {
+      type: String,
+      default: "data",
+    },
+    values: {
+      type: Array,
+    },
+    changes: {
+      type: Object,
+    },
+    signals: {
+      type: Object,
+    },
+    keyFields: {
+      type: Array,
+      default: () => [],
+    },
+  },
+  data() {
+    return { view: null, mounts: 0 };
+  },
+  watch: {
+    spec() {
+      this.mountView();
+    },
+    values() {
+      this.replaceValues();
+    },
+    changes() {
+      this.applyChanges();
+    },
+    signals() {
+      this.applySignals();
+    },
+  },
+  mounted() {
+    this.mountView();
+  },
+  beforeUnmount() {
+    this.mounts += 1;
+    this.view = null;
+  },
+  methods: {
+    // Vega view of the current spec, once VueVega has embedded it
+    async embeddedView(mount) {
+      const previous = this.view;
+      while (mount === this.mounts) {
+        const viz = this.$refs.vega && this.$refs.vega.viz;
+        if (viz && viz.view !== previous) {
+          return viz.view;
+        }
+        await new Promise((resolve) => requestAnimationFrame(resolve));
+      }
+      return null;
+    },
+    async mountView() {
+      this.mounts += 1;
+      const mount = this.mounts;
+      if (!this.spec) {
+        this.view = null;
+        return;
+      }
+      const view = await this.embeddedView(mount);
+      if (!view) {
+        return; // superseded by a newer spec or unmounted
+      }
+      this.view = view;
+      await this.replaceValues();
+      // Changes accumulate since values were set, replaying them is harmless
+      await this.applyChanges();
+      await this.applySignals();
+    },
+    tupleKey(tuple) {
+      return this.keyFields.map((field) => tuple[field]).join("|");
+    },
+    async replaceValues() {
+      if (!this.view || !this.values) {
+        return;
+      }
+      const cs = this.view
+        .changeset()
+        .remove(() => true)
+        .insert(this.values);
+      await this.view.change(this.dataset, cs).runAsync();
+    },
+    async applyChanges() {
+      if (!this.view || !this.changes) {
+        return;
+      }
+      const removed = new Set((this.changes.remove || []).map(this.tupleKey));
+      const cs = this.view
+        .changeset()
+        .remove((tuple) => removed.has(this.tupleKey(tuple)))
+        .insert(this.changes.insert || []);
+      await this.view.change(this.dataset, cs).runAsync();
+    },
+    async applySignals() {
+      if (!this.view || !this.signals) {
+        return;
+      }
+      Object.entries(this.signals).forEach(([name, value]) => {
+        if (name === "width") {
+          this.view.width(value);
+        } else if (name === "height") {
+          this.view.height(value);
+        } else {
+          this.view.signal(name, value);
+        }
+      });
+      await this.view.runAsync();
+    },
+  },
+  render() {
+    return h(resolveComponent("VueVega"), {
+      ref: "vega",
+      spec: this.spec,
+      opt: { actions: false },
+    });
+  },
+};
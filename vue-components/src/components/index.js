@@ -1,5 +1,7 @@
 import CustomWidget from './CustomWidget';
+import VegaDataView from './VegaDataView';
 
 export default {
   'yourCustomWidget':CustomWidget,
+  'usPopulationVegaDataView':VegaDataView,
 };